@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------------
+# Author: hq@trekview.org
+# Created: 2020-06-10
+# Copyright: Trek View
+# Licence: GNU AGPLv3
+# -------------------------------------------------------------------------------
+"""
+Run time and accuracy of the camera clock offset search (--auto-offset): with image GPS, and without image GPS
+for fixed and jittered interval timelapses (where no offset must be trusted) and for distance triggered capture.
+Exits with an error if an offset is accepted for a timelapse, or an offset found is off by more than a second
+(three for distance triggered capture).
+
+    python benchmarks/bench_auto_offset.py [images] [offset seconds]
+"""
+
+import sys
+
+import numpy as np
+
+from common import load_geotagger, timed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    true_offset = float(sys.argv[2]) if len(sys.argv) > 2 else 1234.6
+    geotagger = load_geotagger()
+    rng = np.random.default_rng(0)
+
+    # 1 Hz track of a drive whose speed wanders around 8 m/s, covering the images with an hour either side
+    track_count = count * 3 + 7200
+    speeds = np.empty(track_count)
+    speeds[0] = 8.0
+    for index, noise in enumerate(rng.normal(0, 0.15, track_count - 1), 1):
+        speeds[index] = max(speeds[index - 1] + 0.005 * (8.0 - speeds[index - 1]) + noise, 0.0)
+    headings = np.cumsum(rng.normal(0, 0.05, track_count))
+    latitudes = 51.5 + np.cumsum(speeds * np.cos(headings)) / 111000
+    longitudes = -0.1 + np.cumsum(speeds * np.sin(headings)) / 69000
+    epochs = 1591747200 + np.arange(track_count, dtype='int64')
+    track_store = geotagger.TrackStore(epochs, latitudes, longitudes, np.zeros(track_count))
+
+    # Images every 2 s, with camera times in whole seconds behind the track by true_offset and 5 m of GPS noise
+    true_epochs = epochs[3600] + 2.0 * np.arange(count)
+    image_latitudes = np.interp(true_epochs, epochs, latitudes) + rng.normal(0, 5 / 111000, count)
+    image_longitudes = np.interp(true_epochs, epochs, longitudes) + rng.normal(0, 5 / 69000, count)
+    image_epochs = np.floor(true_epochs - true_offset)
+
+    print('{0:,} images, true offset {1:+.1f} s, searching +/-7200 s\n'.format(count, true_offset))
+    offset, residual = timed('estimate_time_offset (image GPS)', geotagger.estimate_time_offset,
+                             track_store, image_epochs, image_latitudes, image_longitudes, repeat=1)
+    print_offset(offset, residual)
+    check_offset(offset, true_offset)
+
+    # The same images without GPS: a fixed interval timelapse has no cadence to line up with the track
+    offset, residual = timed('estimate_time_offset (fixed interval)', geotagger.estimate_time_offset,
+                             track_store, image_epochs, repeat=1)
+    print_offset(offset, residual)
+    check_refused(offset)
+
+    # A timelapse whose interval jitters between 2 and 3 s, unrelated to the distance travelled
+    true_epochs = epochs[3600] + np.cumsum(rng.choice([2.0, 3.0], count))
+    offset, residual = timed('estimate_time_offset (jittered interval)', geotagger.estimate_time_offset,
+                             track_store, np.floor(true_epochs - true_offset), repeat=1)
+    print_offset(offset, residual)
+    check_refused(offset)
+
+    # Images without GPS taken every 20 m along the track
+    distances = np.concatenate([[0], np.cumsum(geotagger.haversine_array(
+        longitudes[1:], latitudes[1:], longitudes[:-1], latitudes[:-1]))])
+    true_epochs = np.interp(distances[3600] + 20.0 * np.arange(count), distances, epochs)
+    offset, residual = timed('estimate_time_offset (distance cadence)', geotagger.estimate_time_offset,
+                             track_store, np.floor(true_epochs - true_offset), repeat=1)
+    print_offset(offset, residual)
+    # With whole second camera times about 2.5 s apart, a few hundred images only fix the offset to a few seconds
+    check_offset(offset, true_offset, tolerance=3.0)
+
+
+def print_offset(offset, residual):
+    print('offset {0}, residual {1:.3f}\n'.format('refused' if offset is None else '{0:+.1f} s'.format(offset),
+                                                  residual))
+
+
+def check_refused(offset):
+    """
+    Exit with an error if an offset was accepted where the images carry nothing to line up with the track.
+    """
+    if offset is not None:
+        print('offset {0:+.1f} s was accepted, expected no reliable offset'.format(offset))
+        sys.exit(1)
+
+
+def check_offset(offset, true_offset, tolerance=1.0):
+    """
+    Exit with an error if the offset found is further than tolerance seconds from the true offset.
+    """
+    if offset is None or abs(offset - true_offset) > tolerance:
+        print('offset {0} is wrong, expected {1:+.1f} s'.format(offset, true_offset))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
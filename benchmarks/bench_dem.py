@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------------
+# Author: hq@trekview.org
+# Created: 2020-06-10
+# Copyright: Trek View
+# Licence: GNU AGPLv3
+# -------------------------------------------------------------------------------
+"""
+DEM altitude sampling of a whole run at once, on synthetic one arc second SRTM tiles, against sampling
+one point at a time.
+
+    python benchmarks/bench_dem.py [points] [tiles]
+"""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+from common import load_geotagger, timed
+
+HGT_SIZE = 3601
+
+
+def write_hgt_tiles(directory, count):
+    """
+    Write count tiles eastwards from N51W001, return the longitude range they cover.
+    """
+    values = np.arange(HGT_SIZE * HGT_SIZE, dtype='int64').reshape(HGT_SIZE, HGT_SIZE) % 2000
+    values = values.astype('>i2')
+    for tile in range(count):
+        west = tile - 1
+        name = 'N51{0}{1:03d}.hgt'.format('W' if west < 0 else 'E', abs(west))
+        values.tofile(os.path.join(directory, name))
+    return -1, count - 1
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    tiles = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    geotagger = load_geotagger()
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as directory:
+        west, east = write_hgt_tiles(directory, tiles)
+        latitudes = rng.uniform(51, 52, count)
+        longitudes = rng.uniform(west, east, count)
+        print('{0:,} points over {1} tiles of {2} x {2}\n'.format(count, tiles, HGT_SIZE))
+
+        timed('DemTiles', geotagger.DemTiles, directory)
+        timed('DemTiles.sample, cold cache', lambda: geotagger.DemTiles(directory).sample(latitudes, longitudes),
+              count=count)
+        dem_tiles = geotagger.DemTiles(directory)
+        dem_tiles.sample(latitudes, longitudes)
+        timed('DemTiles.sample, warm cache', dem_tiles.sample, latitudes, longitudes, count=count)
+
+        sample = min(count, 10000)
+        timed('DemTiles.sample per point x {0:,}'.format(sample),
+              lambda: [dem_tiles.sample(latitudes[i:i + 1], longitudes[i:i + 1]) for i in range(sample)],
+              count=sample, repeat=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------------
+# Author: hq@trekview.org
+# Created: 2020-06-10
+# Copyright: Trek View
+# Licence: GNU AGPLv3
+# -------------------------------------------------------------------------------
+"""
+Throughput of the speed and time aware filtering stage, and of the heading and pitch stage.
+
+    python benchmarks/bench_motion.py [points]
+"""
+
+import sys
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from common import load_geotagger, timed
+
+
+def make_track(count):
+    """
+    Random walk at ~5 m/s sampled every second, with 1% of the points thrown 100 m away.
+    """
+    rng = np.random.default_rng(0)
+    latitudes = 51.5 + np.cumsum(rng.normal(0, 0.00003, count))
+    longitudes = -0.1 + np.cumsum(rng.normal(0, 0.00003, count))
+    outliers = rng.random(count) < 0.01
+    latitudes[outliers] += 0.001
+    altitudes = 20 + rng.normal(0, 2, count)
+    epochs = 1591747200 + np.arange(count, dtype=float)
+    return epochs, latitudes, longitudes, altitudes
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    geotagger = load_geotagger()
+    epochs, latitudes, longitudes, altitudes = make_track(count)
+
+    print('{0:,} points\n'.format(count))
+    distances = timed('haversine_array', geotagger.haversine_array,
+                      longitudes[1:], latitudes[1:], longitudes[:-1], latitudes[:-1], count=count)
+    distances = np.concatenate([[0], distances])
+    timed('compute_motion', geotagger.compute_motion, epochs, distances, count=count)
+    timed('rolling_median (window 5)', geotagger.rolling_median, latitudes, 5, count=count)
+    timed('compute_directions', geotagger.compute_directions, latitudes, longitudes, altitudes, count=count)
+
+    start = datetime.datetime(2020, 6, 10)
+    df_images = pd.DataFrame({
+        'IMAGE_NAME': ['{0}.jpg'.format(i) for i in range(count)],
+        'ORIGINAL_DATETIME': '',
+        'GPS_DATETIME': [start + datetime.timedelta(seconds=i) for i in range(count)],
+        'LATITUDE': latitudes,
+        'LONGITUDE': longitudes,
+        'ALTITUDE': altitudes,
+    })
+    print('')
+    df_filtered = timed('speed_discard_track_logs (15 m/s)', geotagger.speed_discard_track_logs,
+                        df_images, 15, count=count, repeat=1)
+    print('{0:,} images discarded'.format(count - len(df_filtered)))
+    timed('smooth_track_logs (window 5)', geotagger.smooth_track_logs, df_images, 5, count=count, repeat=1)
+    timed('discard_track_logs (20 m)', geotagger.discard_track_logs, df_images, 20, count=count, repeat=1)
+    list_of_images = df_images.to_dict('records')
+    timed('add_direction_fields', geotagger.add_direction_fields, list_of_images, True, True, count=count, repeat=1)
+
+
+if __name__ == '__main__':
+    main()
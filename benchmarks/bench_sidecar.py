@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------------
+# Author: hq@trekview.org
+# Created: 2020-06-10
+# Copyright: Trek View
+# Licence: GNU AGPLv3
+# -------------------------------------------------------------------------------
+"""
+Bytes written and time of the write stage with XMP sidecars against tags embedded in copies of the images,
+on synthetic 20 MB images. The embedded run needs exiftool on the PATH, without it only its bytes are estimated.
+
+    python benchmarks/bench_sidecar.py [images] [megabytes]
+"""
+
+import os
+import sys
+import shutil
+import datetime
+import tempfile
+
+from common import load_geotagger, timed
+
+IMAGES = 50
+MEGABYTES = 20
+
+# Smallest valid JPEG (SOI, APP0 JFIF, EOI), the padding after EOI stands in for the image data.
+JPEG_HEADER = bytes.fromhex('ffd8ffe000104a46494600010100000100010000ffd9')
+
+
+def make_images(directory, count, size):
+    """
+    Write count synthetic JPEG files of size bytes and return their records with GPS fields.
+    """
+    padding = os.urandom(size - len(JPEG_HEADER))
+    start = datetime.datetime(2020, 6, 10, 10, 0, 0)
+    images = []
+    for index in range(count):
+        path = os.path.join(directory, 'image{0:05d}.jpg'.format(index))
+        with open(path, 'wb') as fh:
+            fh.write(JPEG_HEADER)
+            fh.write(padding)
+        images.append({
+            'IMAGE_NAME': path,
+            'GPS_DATETIME': start + datetime.timedelta(seconds=index),
+            'LATITUDE': 51.5 + index * 1e-5,
+            'LONGITUDE': -0.1 - index * 1e-5,
+            'ALTITUDE': 20.0,
+        })
+    return images
+
+
+def get_directory_size(directory):
+    """
+    Return the bytes of the files in directory that are not hard links to another file.
+    """
+    total = 0
+    for name in os.listdir(directory):
+        stat = os.stat(os.path.join(directory, name))
+        if stat.st_nlink == 1:
+            total += stat.st_size
+    return total
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else IMAGES
+    size = int(float(sys.argv[2]) * 1024 * 1024) if len(sys.argv) > 2 else MEGABYTES * 1024 * 1024
+    geotagger = load_geotagger()
+
+    working_directory = tempfile.mkdtemp()
+    try:
+        input_directory = os.path.join(working_directory, 'input')
+        os.mkdir(input_directory)
+        images = make_images(input_directory, count, size)
+        print('{0} images of {1:.1f} MB'.format(count, size / 1024 / 1024))
+
+        sidecar_directory = os.path.join(working_directory, 'sidecar')
+
+        def write_sidecars():
+            shutil.rmtree(sidecar_directory, ignore_errors=True)
+            geotagger.write_sidecars(sidecar_directory, images)
+
+        timed('sidecar write', write_sidecars, count=count)
+        print('sidecar bytes written: {0:,}'.format(get_directory_size(sidecar_directory)))
+
+        if shutil.which('exiftool') is None:
+            print('exiftool not found, embedded bytes written (one copy of each image): {0:,}'.format(count * size))
+            return
+
+        embed_directory = os.path.join(working_directory, 'embed')
+        from exiftool_custom import exiftool
+
+        def write_embedded():
+            shutil.rmtree(embed_directory, ignore_errors=True)
+            os.mkdir(embed_directory)
+            with exiftool.ExifTool() as et:
+                for image in images:
+                    params = geotagger.get_tag_params(geotagger.get_gps_tags(image))
+                    params.extend([b'-o', bytes(geotagger.get_output_path(embed_directory, image['IMAGE_NAME']),
+                                                'utf-8'), bytes(image['IMAGE_NAME'], 'utf-8')])
+                    et.execute(*params)
+
+        timed('embedded write', write_embedded, count=count, repeat=1)
+        print('embedded bytes written: {0:,}'.format(get_directory_size(embed_directory)))
+    finally:
+        shutil.rmtree(working_directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------------
+# Author: hq@trekview.org
+# Created: 2020-06-10
+# Copyright: Trek View
+# Licence: GNU AGPLv3
+# -------------------------------------------------------------------------------
+"""
+Cold start of the script, from python -X importtime and the wall-clock time of `--version`.
+Pass other copies of the script (e.g. an older version) to compare them.
+
+    python benchmarks/bench_startup.py [script ...]
+"""
+
+import sys
+import time
+import subprocess
+
+from common import ROOT_DIRECTORY
+
+RUNS = 5
+
+
+def get_import_times(script):
+    """
+    Return the total import time in seconds and the slowest top level imports of script --version.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', script, '--version'],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not name.startswith('  '):
+            imports.append((int(cumulative) / 1e6, name.strip()))
+    return sum(seconds for seconds, _ in imports), sorted(imports, reverse=True)[:5]
+
+
+def get_wall_time(script):
+    """
+    Return the fastest wall-clock time in seconds of script --version.
+    """
+    best = None
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, script, '--version'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    scripts = sys.argv[1:] or ['{0}/image-geotagger.py'.format(ROOT_DIRECTORY)]
+    for script in scripts:
+        total, slowest = get_import_times(script)
+        print(script)
+        print('  wall-clock --version {0:>8.3f} s'.format(get_wall_time(script)))
+        print('  imports (cumulative) {0:>8.3f} s'.format(total))
+        for seconds, name in slowest:
+            print('    {0:<20} {1:>8.3f} s'.format(name, seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------------
+# Author: hq@trekview.org
+# Created: 2020-06-10
+# Copyright: Trek View
+# Licence: GNU AGPLv3
+# -------------------------------------------------------------------------------
+"""
+Time and peak memory of merging overlapping track logs (-t with a directory or glob pattern).
+The logs are parsed once up front, so only the merge itself is measured.
+
+    python benchmarks/bench_track_merge.py [points per log] [logs]
+"""
+
+import sys
+import tracemalloc
+
+import numpy as np
+
+from common import load_geotagger, timed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    log_count = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    geotagger = load_geotagger()
+    rng = np.random.default_rng(0)
+
+    # 1 Hz logs of the same capture, each starting a little later and with a few gaps
+    logs = {}
+    for index in range(log_count):
+        epochs = 1591747200 + index * 600 + np.sort(rng.choice(count + count // 10, count, replace=False))
+        logs['log{0}.csv'.format(index)] = [epochs.astype('int64'), 51.5 + rng.normal(0, 0.01, count),
+                                            -0.1 + rng.normal(0, 0.01, count), 20 + rng.normal(0, 2, count),
+                                            rng.choice([0.8, 1.2, 2.5, np.nan], count)]
+    geotagger.read_track_log_arrays = lambda log_path: [column.copy() for column in logs[log_path]]
+
+    print('{0} logs of {1:,} points\n'.format(log_count, count))
+    for merge_rule in geotagger.TRACK_MERGE_RULES:
+        track_store = timed('merge_track_logs ({0})'.format(merge_rule), geotagger.merge_track_logs,
+                            list(logs), merge_rule, count=count * log_count)
+
+        tracemalloc.start()
+        geotagger.merge_track_logs(list(logs), merge_rule)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print('{0:,} points merged, peak memory {1:.1f} MB ({2:.1f} MB of merged track)\n'.format(
+            len(track_store), peak / 1e6, len(track_store) * 32 / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------------
+# Author: hq@trekview.org
+# Created: 2020-06-10
+# Copyright: Trek View
+# Licence: GNU AGPLv3
+# -------------------------------------------------------------------------------
+"""
+Load time of a compiled track store against parsing the csv track log it was made from.
+
+    python benchmarks/bench_track_store.py [points] [csv points]
+"""
+
+import os
+import sys
+import tempfile
+import datetime
+
+import numpy as np
+
+from common import load_geotagger, timed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000000
+    csv_count = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+    geotagger = load_geotagger()
+
+    rng = np.random.default_rng(0)
+    epochs = 1591747200 + np.arange(count, dtype='int64')
+    latitudes = 51.5 + np.cumsum(rng.normal(0, 0.00003, count))
+    longitudes = -0.1 + np.cumsum(rng.normal(0, 0.00003, count))
+    altitudes = 20 + rng.normal(0, 2, count)
+
+    with tempfile.TemporaryDirectory() as directory:
+        store_path = os.path.join(directory, 'track.igtrack')
+        geotagger.TrackStore(epochs, latitudes, longitudes, altitudes).save(store_path)
+
+        csv_path = os.path.join(directory, 'track.csv')
+        with open(csv_path, 'w') as fh:
+            fh.write('GPSDateTime,GPSLatitude,GPSLongitude,GPSAltitude\n')
+            for i in range(csv_count):
+                date_time = datetime.datetime(1970, 1, 1) + datetime.timedelta(seconds=int(epochs[i]))
+                fh.write('{0},{1},{2},{3}\n'.format(date_time.strftime('%Y:%m:%d %H:%M:%SZ'),
+                                                    latitudes[i], longitudes[i], altitudes[i]))
+
+        print('{0:,} point track store, {1:.1f} MB\n'.format(count, os.path.getsize(store_path) / 1e6))
+        track_store = timed('TrackStore.load', geotagger.TrackStore.load, store_path)
+        keys = [(datetime.datetime(1970, 1, 1) + datetime.timedelta(seconds=int(epoch))).strftime('%Y:%m:%d %H:%M:%S')
+                for epoch in rng.choice(epochs, 100000)]
+        timed('TrackStore.get x 100,000', lambda: [track_store.get(key) for key in keys], count=len(keys))
+
+        print('\n{0:,} point csv track log'.format(csv_count))
+        timed('load_gps_track_log', geotagger.load_gps_track_log, csv_path, count=csv_count, repeat=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------------
+# Author: hq@trekview.org
+# Created: 2020-06-10
+# Copyright: Trek View
+# Licence: GNU AGPLv3
+# -------------------------------------------------------------------------------
+"""
+Check that sharded runs (--shards, --shard-dir) and watch mode (--watch) write the same GPS tags as a single
+run over the whole sequence, for every filter, on synthetic images with stops, outliers and missing altitudes.
+Sharded plans are also passed through the JSON of a shard directory. Exits with an error on any difference.
+
+    python benchmarks/check_equivalence.py [images] [watch images]
+"""
+
+import sys
+import json
+import random
+import tempfile
+import datetime
+
+from common import load_geotagger
+
+geotagger = load_geotagger()
+
+FILTERS = [
+    {},
+    {'discard': 50},
+    {'normalise': 50},
+    {'max_speed': 10},
+    {'smooth': 2},
+    {'smooth': 4},
+    {'smooth': 5},
+]
+SHARDS = [2, 3, 7]
+
+
+class RecordGeoTagger(geotagger.IncrementalGeoTagger):
+    """
+    IncrementalGeoTagger reading prepared image records and keeping the written tags in memory.
+    """
+
+    def __init__(self, records, **options):
+        super().__init__(None, tempfile.gettempdir(), heading=True, pitch=True, **options)
+        self.records = records
+
+    def read_image(self, image):
+        return dict(self.records[image])
+
+    def write_image(self, image, tags):
+        self.written_tags[image] = tags
+
+
+def make_images(count, seed=0):
+    """
+    Time sorted image records along a path with stops, position outliers and missing altitudes.
+    """
+    rng = random.Random(seed)
+    start = datetime.datetime(2020, 6, 10, 10, 0, 0)
+    latitude, longitude, altitude = 51.5, -0.1, 20.0
+    images = []
+    index = 0
+    while len(images) < count:
+        stop = rng.random() < 0.05
+        for _ in range(rng.randint(2, 6) if stop else 1):
+            if not stop:
+                latitude += rng.uniform(0, 8) / 111000
+                longitude += rng.uniform(-4, 4) / 69000
+                altitude += rng.uniform(-1, 1)
+            outlier = rng.random() < 0.03
+            date_time = start + datetime.timedelta(seconds=2 * index)
+            images.append({
+                'IMAGE_NAME': 'image{0:05d}.jpg'.format(index),
+                'METADATA': {},
+                'ORIGINAL_DATETIME': date_time.strftime('%Y:%m:%d %H:%M:%S'),
+                'GPS_DATETIME': date_time,
+                'LATITUDE': latitude + (rng.uniform(200, 800) / 111000 if outlier else 0),
+                'LONGITUDE': longitude,
+                'ALTITUDE': None if rng.random() < 0.05 else round(altitude, 2),
+            })
+            index += 1
+    return images[:count]
+
+
+def get_tags(list_of_plans):
+    """
+    Add the directions to the merged plans of a run and return the tags written for each image.
+    """
+    list_of_plans = [dict(plan) for plan in list_of_plans]
+    geotagger.add_direction_fields(list_of_plans, heading=True, pitch=True)
+    return {plan['IMAGE_NAME']: geotagger.get_gps_tags(plan) for plan in list_of_plans}
+
+
+def get_filter_options(options):
+    return dict({'discard': 0, 'normalise': 0, 'max_speed': 0, 'smooth': 0}, **options)
+
+
+def through_json(value):
+    """
+    Round trip a shard task or result through the JSON of a shard directory.
+    """
+    return json.loads(json.dumps(value, default=geotagger.get_shard_json_value),
+                      object_hook=geotagger.get_shard_json_object)
+
+
+def get_sharded_tags(list_of_images, shards, filter_options):
+    list_of_plans = [through_json(geotagger.run_shard_task(through_json(task)))
+                     for task in geotagger.get_plan_shard_tasks(list_of_images, shards, filter_options)]
+    return get_tags([image for plan in list_of_plans for image in plan])
+
+
+def get_watched_tags(list_of_images, filter_options, batches):
+    records = {image['IMAGE_NAME']: image for image in list_of_images}
+    incremental = RecordGeoTagger(records, **filter_options)
+    for batch in batches:
+        incremental.add_images(batch)
+    return {image: tags for image, tags in incremental.written_tags.items() if tags}
+
+
+def get_arrival_orders(list_of_images, seed=0):
+    """
+    Batches of image names in the orders they may arrive in a watched folder.
+    """
+    rng = random.Random(seed)
+    names = [image['IMAGE_NAME'] for image in list_of_images]
+    shuffled = rng.sample(names, len(names))
+    batches = []
+    while shuffled:
+        size = rng.randint(1, 20)
+        batches.append(shuffled[:size])
+        shuffled = shuffled[size:]
+    return {
+        'in order': [[name] for name in names],
+        'reversed': [[name] for name in reversed(names)],
+        'shuffled': [[name] for name in rng.sample(names, len(names))],
+        'shuffled batches': batches,
+    }
+
+
+def check(name, expected, actual):
+    """
+    Print whether two {image: tags} dicts match, and the first difference if not. Return True if they match.
+    """
+    if expected == actual:
+        print('ok      {0}'.format(name))
+        return True
+    for image in sorted(set(expected) | set(actual)):
+        if expected.get(image) != actual.get(image):
+            print('FAILED  {0}: {1} expected {2}, got {3}'.format(name, image, expected.get(image), actual.get(image)))
+            break
+    return False
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2500
+    watch_count = int(sys.argv[2]) if len(sys.argv) > 2 else 600
+    passed = True
+
+    # A small job takes the records path of discard and normalise, a large one the pandas path
+    for size in sorted({geotagger.FAST_PATH_MAX_IMAGES // 3, count}):
+        list_of_images = make_images(size)
+        for options in FILTERS:
+            filter_options = get_filter_options(options)
+            expected = get_tags(geotagger.filter_images([dict(image) for image in list_of_images], **filter_options))
+            for shards in SHARDS:
+                name = '{0} images, {1}, {2} shards'.format(size, options or 'no filter', shards)
+                passed &= check(name, expected, get_sharded_tags(list_of_images, shards, filter_options))
+
+    list_of_images = make_images(watch_count, seed=1)
+    for options in FILTERS:
+        filter_options = get_filter_options(options)
+        expected = get_tags(geotagger.filter_images([dict(image) for image in list_of_images], **filter_options))
+        for order, batches in get_arrival_orders(list_of_images).items():
+            name = 'watch {0} images, {1}, {2}'.format(watch_count, options or 'no filter', order)
+            passed &= check(name, expected, get_watched_tags(list_of_images, filter_options, batches))
+
+    print('\nAll runs match' if passed else '\nSome runs differ from a single run')
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------------
+# Author: hq@trekview.org
+# Created: 2020-06-10
+# Copyright: Trek View
+# Licence: GNU AGPLv3
+# -------------------------------------------------------------------------------
+
+import os
+import sys
+import time
+import importlib.util
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_geotagger():
+    """
+    Import image-geotagger.py as a module, its file name is not a valid module name.
+    """
+    sys.path.insert(0, ROOT_DIRECTORY)
+    spec = importlib.util.spec_from_file_location('image_geotagger', os.path.join(ROOT_DIRECTORY, 'image-geotagger.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def timed(name, function, *args, count=None, repeat=3):
+    """
+    Run function repeat times, print the best run time and points per second, return the last result.
+    """
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    if count:
+        print('{0:<40} {1:>10.4f} s {2:>14,.0f} points/s'.format(name, best, count / best))
+    else:
+        print('{0:<40} {1:>10.4f} s'.format(name, best))
+    return result
@@ -11,15 +11,104 @@ import argparse
 import sys
 import math
 from pathlib import Path
-import xml.sax
 import csv
 import datetime
+import calendar
 import ntpath
+import struct
+import mmap
+import hashlib
+import array
+import glob
+import warnings
+import bisect
+import time
+import shutil
 
-import pandas as pd
-import gpxpy
 from exiftool_custom import exiftool
 
+# Jobs with at most this many images, and no stage that needs pandas, are processed as plain records.
+FAST_PATH_MAX_IMAGES = 1000
+
+# Images with any of these tags already have geotags, and are left alone in missing mode.
+MISSING_MODE_KEYS = ['Composite:GPSDateTime', 'Composite:GPSLatitude', 'Composite:GPSLongitude',
+                     'Composite:GPSAltitude', 'EXIF:GPSDateStamp', 'EXIF:GPSTimeStamp']
+
+# Seconds between scans of a watched folder, or between inotify reads.
+WATCH_INTERVAL = 2.0
+
+# Output formats: tags embedded in a copy of each image, or XMP sidecars next to hard links of the originals.
+OUTPUT_FORMATS = ['embed', 'sidecar']
+SIDECAR_WORKERS = 16
+XMP_NAMESPACES = {
+    'x': 'adobe:ns:meta/',
+    'rdf': 'http://www.w3.org/1999/02/22-rdf-syntax-ns#',
+    'exif': 'http://ns.adobe.com/exif/1.0/',
+    'GPano': 'http://ns.google.com/photos/1.0/panorama/',
+}
+
+# Smallest time delta in seconds used for speeds, as image and log times have a one second resolution.
+MIN_TIME_DELTA = 1.0
+
+# Compiled track store: header (magic, version, point count, sha256 of the source log), padded to
+# TRACK_STORE_HEADER_SIZE bytes, then the int64 epoch and float64 latitude, longitude and altitude arrays.
+TRACK_STORE_MAGIC = b'IGTRACK1'
+TRACK_STORE_VERSION = 1
+TRACK_STORE_HEADER = struct.Struct('<8sIQ32s')
+TRACK_STORE_HEADER_SIZE = 64
+TRACK_STORE_EXTENSION = '.igtrack'
+
+TRACK_LOG_EXTENSIONS = ['.gpx', '.csv']
+TRACK_MERGE_RULES = ['priority', 'hdop']
+
+# Camera clock offset search: coarse grid step in seconds, finest step, number of coarse candidates refined,
+# images sampled for the coarse grid, fraction of images that must fall inside the track for a candidate
+# largest cost of the best offset, as a fraction of the median coarse grid cost, for it to be trusted and
+# smallest coefficient of variation of the times between images without GPS for them to have a cadence.
+OFFSET_COARSE_STEP = 60.0
+OFFSET_RESOLUTION = 0.1
+OFFSET_REFINED_CANDIDATES = 3
+OFFSET_COARSE_SAMPLE = 5000
+OFFSET_MIN_COVERAGE = 0.5
+OFFSET_MAX_CONTRAST = 0.7
+OFFSET_MIN_INTERVAL_VARIATION = 0.1
+
+# Digital elevation model tiles: SRTM .hgt files and, with the optional tifffile package, GeoTIFFs in
+# geographic coordinates. Altitudes fill images without one or replace all of them, tiles are memory-mapped
+# and at most DEM_CACHE_SIZE of them are kept open.
+DEM_EXTENSIONS = ['.hgt', '.tif', '.tiff']
+DEM_MODES = ['fill', 'replace']
+DEM_CACHE_SIZE = 16
+HGT_VOID = -32768
+
+# Local geotagging service (serve, submit and status commands), the number of tracks each worker keeps loaded
+# and the characters kept from the end of the output of each job.
+SERVICE_HOST = '127.0.0.1'
+SERVICE_PORT = 8765
+TRACK_CACHE_SIZE = 8
+JOB_OUTPUT_LIMIT = 10000
+
+# Sharded runs: metadata tags kept from the read phase, image record fields passed between phases,
+# seconds between checks of a shard directory and the file a coordinator leaves in it when its run is over.
+# A worker touches the claim of its running task every heartbeat interval, a claim left untouched for
+# the claim timeout is taken to belong to a dead worker and the task is run again.
+SHARD_METADATA_KEYS = ['Composite:GPSLatitude', 'Composite:GPSLongitude', 'Composite:GPSAltitude']
+SHARD_IMAGE_KEYS = ['IMAGE_NAME', 'ORIGINAL_DATETIME', 'GPS_DATETIME', 'LATITUDE', 'LONGITUDE', 'ALTITUDE']
+SHARD_POLL_INTERVAL = 1.0
+SHARD_FINISHED_FILE = 'finished.json'
+SHARD_HEARTBEAT_INTERVAL = 10.0
+SHARD_CLAIM_TIMEOUT = 120.0
+
+# Warm exiftool process and track cache of a GeotagWorkerPool worker process, set by start_worker().
+_worker_exiftool = None
+_worker_track_cache = None
+
+
+class GeotaggerError(Exception):
+    """
+    A geotagging job can not continue, the message explains why to the user.
+    """
+
 
 def haversine(lon1, lat1, lon2, lat2):
     """
@@ -39,6 +128,132 @@ def haversine(lon1, lat1, lon2, lat2):
     return distance
 
 
+def haversine_array(lon1, lat1, lon2, lat2):
+    """
+    Vectorised version of haversine() for whole arrays of points (decimal degrees).
+    Returns the distances in meters.
+    """
+    import numpy as np
+
+    lon1, lat1, lon2, lat2 = [np.radians(np.asarray(value, dtype=float)) for value in (lon1, lat1, lon2, lat2)]
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    c = 2 * np.arcsin(np.sqrt(a))
+    r = 6371
+
+    return (c * r) * 1000
+
+
+def get_epoch_seconds(date_time):
+    """
+    Return the seconds since epoch of a datetime or EXIF date string, or nan if it is unknown.
+    The wall-clock time is read as UTC, the same way track log and image times are matched.
+    """
+    if isinstance(date_time, str):
+        try:
+            date_time = datetime.datetime.strptime(date_time, '%Y:%m:%d %H:%M:%S')
+        except ValueError:
+            return math.nan
+    if not isinstance(date_time, datetime.datetime):
+        return math.nan
+    return calendar.timegm(date_time.timetuple()) + date_time.microsecond / 1000000
+
+
+def compute_motion(epochs, distances):
+    """
+    Calculate the time delta (s), implied speed (m/s) and acceleration (m/s2) of every point
+    from its epoch time and the distance in meters to the previous point.
+    Time deltas are at least MIN_TIME_DELTA as image and log times have a one second resolution.
+    Points without a usable time get nan values.
+    """
+    import numpy as np
+
+    epochs = np.asarray(epochs, dtype=float)
+    distances = np.asarray(distances, dtype=float)
+
+    time_delta = np.zeros(len(epochs))
+    speed = np.zeros(len(epochs))
+    acceleration = np.zeros(len(epochs))
+    if len(epochs) < 2:
+        return time_delta, speed, acceleration
+
+    time_delta[1:] = np.maximum(np.abs(np.diff(epochs)), MIN_TIME_DELTA)
+    speed[1:] = distances[1:] / time_delta[1:]
+    acceleration[2:] = np.diff(speed[1:]) / time_delta[2:]
+
+    return time_delta, speed, acceleration
+
+
+def rolling_median(values, window):
+    """
+    Centred rolling median of an array, an even window has one more value before the centre than after it.
+    Values without a full window at either end, and values whose window contains a nan, are kept as they are.
+    """
+    import numpy as np
+
+    values = np.asarray(values, dtype=float)
+    smoothed = values.copy()
+    half = window // 2
+    if window > 1 and len(values) >= window:
+        windows = np.lib.stride_tricks.sliding_window_view(values, window)
+        smoothed[half:half + len(windows)] = np.median(windows, axis=1)
+
+    return np.where(np.isnan(smoothed), values, smoothed)
+
+
+def fill_gaps(values):
+    """
+    Replace the nan values of an array with the last value before them, or the first value after them.
+    """
+    import numpy as np
+
+    values = np.asarray(values, dtype=float)
+    known = ~np.isnan(values)
+    if not known.any():
+        return values
+    previous = np.maximum.accumulate(np.where(known, np.arange(len(values)), 0))
+    values = np.where(known[previous], values[previous], np.nan)
+    return np.where(np.isnan(values), values[np.argmax(known)], values)
+
+
+def compute_directions(latitudes, longitudes, altitudes):
+    """
+    Calculate the heading (degrees clockwise from true north) and pitch (degrees above the horizon)
+    of every point towards the next point, the last point keeps the direction it was reached from.
+    Points at the same position as the next one keep the direction of the point before them.
+    Pitch is nan where an altitude is unknown.
+    """
+    import numpy as np
+
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    altitudes = np.asarray(altitudes, dtype=float)
+
+    heading = np.full(len(latitudes), np.nan)
+    pitch = np.full(len(latitudes), np.nan)
+    if len(latitudes) < 2:
+        return heading, pitch
+
+    lat1, lat2 = np.radians(latitudes[:-1]), np.radians(latitudes[1:])
+    d_lon = np.radians(longitudes[1:] - longitudes[:-1])
+    segment_heading = np.degrees(np.arctan2(np.sin(d_lon) * np.cos(lat2),
+                                            np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(d_lon)))
+    distances = haversine_array(longitudes[:-1], latitudes[:-1], longitudes[1:], latitudes[1:])
+    segment_pitch = np.degrees(np.arctan2(altitudes[1:] - altitudes[:-1], distances))
+
+    # Stops keep the direction of the point before them, pitch stays unknown where an altitude is missing
+    missing_altitude = np.isnan(altitudes[:-1]) | np.isnan(altitudes[1:])
+    stopped = ~(distances > 0)
+    segment_heading = fill_gaps(np.where(stopped, np.nan, segment_heading)) % 360
+    segment_pitch = fill_gaps(np.where(stopped | missing_altitude, np.nan, segment_pitch))
+    segment_pitch[missing_altitude] = np.nan
+
+    heading[:-1], heading[-1] = segment_heading, segment_heading[-1]
+    pitch[:-1], pitch[-1] = segment_pitch, segment_pitch[-1]
+    return heading, pitch
+
+
 def get_files(path):
     """
     Return a list of files, or directories.
@@ -52,6 +267,15 @@ def get_files(path):
     return list_of_files
 
 
+def get_output_path(output_photo_directory, image):
+    """
+    Path of the geotagged copy of an image in the output directory.
+    """
+    image_name = ntpath.basename(image)
+    return os.path.join(os.path.abspath(output_photo_directory),
+                        '{0}.{1}'.format(image_name.split('.')[0], image.split('.')[-1]))
+
+
 def clean_up_new_files(output_photo_directory, list_of_files):
     """
     As Exiftool creates a copy of the original image when processing,
@@ -66,8 +290,7 @@ def clean_up_new_files(output_photo_directory, list_of_files):
     for image in list_of_files:
         image_head, image_name = ntpath.split(image)
         try:
-            os.rename(image, os.path.join(os.path.abspath(output_photo_directory),
-                                          '{0}.{1}'.format(image_name.split('.')[0], image.split('.')[-1])))
+            os.rename(image, get_output_path(output_photo_directory, image))
             os.rename(os.path.join(os.path.abspath(image_head), '{0}_original'.format(image_name)), image)
         except PermissionError:
             print("Image {0} is still in use by Exiftool's process or being moved'."
@@ -76,6 +299,13 @@ def clean_up_new_files(output_photo_directory, list_of_files):
     print('Output files saved to {0}'.format(os.path.abspath(output_photo_directory)))
 
 
+def is_missing(value):
+    """
+    Check if a value is None, nan or NaT
+    """
+    return value is None or value != value
+
+
 def filter_metadata(metadata, keys):
     """
     If metadata contains certain key values then return false
@@ -101,11 +331,8 @@ def parse_metadata(dfrow, keys):
             data = dict_metadata[key]
             values.append(data)
         except KeyError:
-            print('\n\nAn image was encountered that did not have the required metadata.')
-            print('Image: {0}'.format(dfrow['IMAGE_NAME']))
-            print('Missing metadata key: {0}\n\n'.format(key.split(':')[-1]))
-            input('Press any key to quit')
-            quit()
+            raise GeotaggerError('An image was encountered that did not have the required metadata.\n'
+                                 'Image: {0}\nMissing metadata key: {1}'.format(dfrow['IMAGE_NAME'], key.split(':')[-1]))
     return values
 
 
@@ -113,6 +340,8 @@ def validate_file_type(path):
     """
     Check the file type is csv or xml.
     """
+    import xml.sax
+
     with open(path, 'rb') as fh:
         try:
             xml.sax.parse(fh, xml.sax.ContentHandler())
@@ -129,20 +358,18 @@ def validate_file_type(path):
     return 'file type is not correct'
 
 
-def load_gps_track_log(log_path):
+def iter_gps_track_points(log_path):
     """
-    load gps track log.
-    support kml, gpx and exif csv file.
+    Yield (GPS_DATETIME, Latitude, Longitude, Altitude, HDOP) for each point of a gpx or exif csv
+    track log, and None for each point without a time or position.
+    Altitude and HDOP are None when the log does not have them.
     """
     file_type = validate_file_type(log_path)
-    track_logs = {}
-    loaded_points = 0
-    removed_points = 0
 
     if file_type == 'file type is not correct':
-        return False
+        raise ValueError('{0} is not a gpx or csv track log'.format(log_path))
     elif file_type == 'csv':
-        # Parse exif csv file to dict list
+        # Parse exif csv file row by row
         with open(log_path, 'r', encoding='utf8') as log_file:
             reader = csv.DictReader(log_file)
             for i in reader:
@@ -150,50 +377,499 @@ def load_gps_track_log(log_path):
                 latitude = i.get('GPSLatitude')
                 longitude = i.get('GPSLongitude')
                 altitude = i.get('GPSAltitude')
+                hdop = i.get('GPSDOP') or i.get('HDOP')
                 if date_time and latitude and longitude:
-                    new_date_time = datetime.datetime.strptime(date_time, '%Y:%m:%d %H:%M:%SZ')
-                    i.update({
-                        'GPS_DATETIME': new_date_time,
-                        'Latitude': float(latitude),
-                        'Longitude': float(longitude),
-                        'Altitude': float(altitude) if altitude else None
-                    })
-                    track_logs[new_date_time.strftime('%Y:%m:%d %H:%M:%S')] = i
-                    loaded_points += 1
+                    yield (datetime.datetime.strptime(date_time, '%Y:%m:%d %H:%M:%SZ'),
+                           float(latitude),
+                           float(longitude),
+                           float(altitude) if altitude else None,
+                           float(hdop) if hdop else None)
                 else:
-                    removed_points += 1
+                    yield None
     else:
+        import gpxpy
+
         with open(log_path, 'r') as gpxfile:
             gpxfile.seek(0)
             try:
                 gpx = gpxpy.parse(gpxfile)
-                for track in gpx.tracks:
-                    for segment in track.segments:
-                        for point in segment.points:
-                            if point.time:
-                                track_data = {
-                                    'GPS_DATETIME': point.time,
-                                    'Latitude': point.latitude,
-                                    'Longitude': point.longitude,
-                                    'Altitude': point.elevation
-                                }
-                                track_logs[point.time.strftime('%Y:%m:%d %H:%M:%S')] = track_data
-                                loaded_points += 1
-                            else:
-                                removed_points += 1
-                            
             except Exception as e:
-                return False
+                raise ValueError('{0} is not a valid gpx track log: {1}'.format(log_path, e))
+            for track in gpx.tracks:
+                for segment in track.segments:
+                    for point in segment.points:
+                        if point.time:
+                            yield (point.time, point.latitude, point.longitude, point.elevation,
+                                   point.horizontal_dilution)
+                        else:
+                            yield None
+
+
+def load_gps_track_log(log_path):
+    """
+    load gps track log.
+    support gpx and exif csv file.
+    """
+    track_logs = {}
+    loaded_points = 0
+    removed_points = 0
+
+    try:
+        for point in iter_gps_track_points(log_path):
+            if point:
+                date_time, latitude, longitude, altitude, hdop = point
+                track_logs[date_time.strftime('%Y:%m:%d %H:%M:%S')] = {
+                    'GPS_DATETIME': date_time,
+                    'Latitude': latitude,
+                    'Longitude': longitude,
+                    'Altitude': altitude
+                }
+                loaded_points += 1
+            else:
+                removed_points += 1
+    except ValueError:
+        return False
     print('Loaded Points : {} \n\nRemoved Points: {}'.format(loaded_points, removed_points))
     return track_logs
 
 
-def get_geo_data_from_log(df_row, track_logs):
+def get_track_log_paths(track_log):
+    """
+    Return the track log files given by a file, a directory of gpx / csv files or a glob pattern.
+    Directories and patterns are sorted by file name.
+    """
+    if os.path.isdir(track_log):
+        return sorted(path for path in get_files(track_log)
+                      if os.path.splitext(path)[1].lower() in TRACK_LOG_EXTENSIONS)
+    if glob.has_magic(track_log):
+        return sorted(path for path in glob.glob(track_log) if os.path.isfile(path))
+    return [track_log]
+
+
+def read_track_log_arrays(log_path):
+    """
+    Parse a track log into time sorted arrays of epoch (int64), latitude, longitude, altitude and HDOP.
+    Points are appended to compact arrays as they are parsed, missing values are nan.
+    """
+    import numpy as np
+
+    epochs = array.array('q')
+    values = [array.array('d') for _ in range(4)]
+    for point in iter_gps_track_points(log_path):
+        if point:
+            epochs.append(int(get_epoch_seconds(point[0])))
+            for column, value in zip(values, point[1:]):
+                column.append(math.nan if value is None else value)
+
+    epochs = np.frombuffer(epochs, dtype='int64')
+    order = np.argsort(epochs, kind='stable')
+    return [epochs[order]] + [np.frombuffer(column, dtype=float)[order] for column in values]
+
+
+def merge_track_logs(log_paths, merge_rule='priority'):
+    """
+    Merge several track logs into one time ordered TrackStore, one log at a time.
+    When logs share a timestamp the point of the earliest log in log_paths wins, or with
+    merge_rule 'hdop' the point with the lowest HDOP (then the earliest log).
+    Within one log the last point logged at a time wins, like load_gps_track_log(), except with
+    merge_rule 'hdop' where the point with the lowest HDOP wins (then the last logged).
+    """
+    import numpy as np
+
+    if merge_rule not in TRACK_MERGE_RULES:
+        raise ValueError('Track merge rule must be one of {0}'.format(', '.join(TRACK_MERGE_RULES)))
+
+    def keep_first_points(columns, tie_break):
+        # Sort by time, HDOP key and tie break, then keep the first point of each time
+        order = np.lexsort((tie_break, columns[4], columns[0]))
+        epochs = columns[0][order]
+        first = np.ones(len(epochs), dtype=bool)
+        first[1:] = epochs[1:] != epochs[:-1]
+        order = order[first]
+        return [column[order] for column in columns]
+
+    # Epoch, latitude, longitude, altitude and HDOP key of the points merged so far
+    merged = None
+    log_count = point_count = 0
+    for log_path in log_paths:
+        try:
+            log = read_track_log_arrays(log_path)
+        except ValueError as e:
+            print('Skipping track log: {0}'.format(e))
+            continue
+        log_count += 1
+        point_count += len(log[0])
+        if merge_rule == 'hdop':
+            log[4] = np.where(np.isnan(log[4]), np.inf, log[4])
+        else:
+            log[4] = np.zeros(len(log[0]))
+        log = keep_first_points(log, -np.arange(len(log[0])))
+
+        if merged is None:
+            merged = log
+        else:
+            # The merged points come first, so they win ties with the points of this log
+            columns = [np.concatenate([old, new]) for old, new in zip(merged, log)]
+            merged = log = None
+            merged = keep_first_points(columns, np.arange(len(columns[0])))
+            del columns
+
+    if merged is None:
+        merged = [np.zeros(0, dtype='int64')] + [np.zeros(0) for _ in range(4)]
+    print('Merged {0} track logs: {1} points, {2} duplicate timestamps resolved by {3}'.format(
+        log_count, len(merged[0]), point_count - len(merged[0]), merge_rule))
+    return TrackStore(*merged[:4])
+
+
+def get_file_checksum(path):
+    """
+    Return the sha256 digest of a file.
+    """
+    checksum = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(1024 * 1024), b''):
+            checksum.update(block)
+    return checksum.digest()
+
+
+def is_track_store(path):
+    """
+    Check the file is a compiled track store.
+    """
+    with open(path, 'rb') as fh:
+        return fh.read(len(TRACK_STORE_MAGIC)) == TRACK_STORE_MAGIC
+
+
+class TrackStore(object):
+    """
+    Time sorted track log held in arrays, either in memory or memory-mapped from a compiled track store.
+    Epochs are the log wall-clock times in seconds, read as UTC like get_epoch_seconds().
+    get() looks up a point the same way as the dict returned by load_gps_track_log().
+    """
+
+    def __init__(self, epochs, latitudes, longitudes, altitudes, checksum=b''):
+        self.epochs = epochs
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+        self.altitudes = altitudes
+        self.checksum = checksum
+
+    @classmethod
+    def from_track_logs(cls, track_logs, checksum=b''):
+        """
+        Build a track store from the dict returned by load_gps_track_log().
+        """
+        import numpy as np
+
+        epochs = np.array([get_epoch_seconds(key) for key in track_logs], dtype='int64')
+        order = np.argsort(epochs, kind='stable')
+        points = list(track_logs.values())
+        latitudes = np.array([point['Latitude'] for point in points], dtype=float)
+        longitudes = np.array([point['Longitude'] for point in points], dtype=float)
+        altitudes = np.array([point['Altitude'] if point['Altitude'] is not None else np.nan for point in points],
+                             dtype=float)
+        return cls(epochs[order], latitudes[order], longitudes[order], altitudes[order], checksum)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Memory-map a compiled track store. The pages are shared with any other process reading the same file.
+        """
+        import numpy as np
+
+        with open(path, 'rb') as fh:
+            buffer = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, checksum = TRACK_STORE_HEADER.unpack_from(buffer)
+        if magic != TRACK_STORE_MAGIC or version != TRACK_STORE_VERSION:
+            raise ValueError('{0} is not a version {1} track store'.format(path, TRACK_STORE_VERSION))
+
+        arrays = [
+            np.frombuffer(buffer, dtype=dtype, count=count, offset=TRACK_STORE_HEADER_SIZE + i * count * 8)
+            for i, dtype in enumerate(['<i8', '<f8', '<f8', '<f8'])
+        ]
+        return cls(*arrays, checksum=checksum)
+
+    def save(self, path):
+        """
+        Write the track store to path. The file is replaced atomically so running processes keep their mapping.
+        """
+        import numpy as np
+
+        temporary_path = '{0}.tmp{1}'.format(path, os.getpid())
+        with open(temporary_path, 'wb') as fh:
+            header = TRACK_STORE_HEADER.pack(TRACK_STORE_MAGIC, TRACK_STORE_VERSION, len(self), self.checksum)
+            fh.write(header.ljust(TRACK_STORE_HEADER_SIZE, b'\0'))
+            fh.write(np.ascontiguousarray(self.epochs, dtype='<i8').tobytes())
+            for values in [self.latitudes, self.longitudes, self.altitudes]:
+                fh.write(np.ascontiguousarray(values, dtype='<f8').tobytes())
+        os.replace(temporary_path, path)
+
+    def __len__(self):
+        return len(self.epochs)
+
+    def get(self, date_time, default=None):
+        """
+        Return the point logged at date_time ('%Y:%m:%d %H:%M:%S'), or default.
+        """
+        import numpy as np
+
+        epoch = get_epoch_seconds(date_time)
+        if math.isnan(epoch):
+            return default
+        index = int(np.searchsorted(self.epochs, int(epoch)))
+        if index == len(self.epochs) or self.epochs[index] != int(epoch):
+            return default
+
+        altitude = float(self.altitudes[index])
+        return {
+            'GPS_DATETIME': datetime.datetime(1970, 1, 1) + datetime.timedelta(seconds=int(self.epochs[index])),
+            'Latitude': float(self.latitudes[index]),
+            'Longitude': float(self.longitudes[index]),
+            'Altitude': None if math.isnan(altitude) else altitude
+        }
+
+
+def order_track_log_paths(log_paths, track_priority=None):
+    """
+    Move the track logs named in track_priority (file names, highest priority first) to the front.
+    """
+    if not track_priority:
+        return log_paths
+    names = [name.strip() for name in track_priority.split(',')]
+    return sorted(log_paths, key=lambda path: names.index(ntpath.basename(path))
+                  if ntpath.basename(path) in names else len(names))
+
+
+def compile_track(track_log, store_path, merge_rule='priority', track_priority=None):
+    """
+    Compile a gpx or csv track log, or the merge of several (see load_track), into a track store,
+    unless the store is already up to date.
+    """
+    log_paths = order_track_log_paths(get_track_log_paths(track_log), track_priority)
+    if not log_paths or not all(os.path.isfile(log_path) for log_path in log_paths):
+        return False
+
+    if len(log_paths) == 1:
+        checksum = get_file_checksum(log_paths[0])
+    else:
+        checksum = hashlib.sha256(merge_rule.encode('utf-8') + b''.join(
+            get_file_checksum(log_path) for log_path in log_paths)).digest()
+    if os.path.isfile(store_path) and is_track_store(store_path):
+        try:
+            if TrackStore.load(store_path).checksum == checksum:
+                print('Track store {0} is up to date'.format(store_path))
+                return True
+        except ValueError:
+            pass
+
+    if len(log_paths) == 1:
+        track_logs = load_gps_track_log(log_paths[0])
+        if not track_logs:
+            return False
+        track_store = TrackStore.from_track_logs(track_logs, checksum)
+    else:
+        track_store = merge_track_logs(log_paths, merge_rule)
+        track_store.checksum = checksum
+        if not len(track_store):
+            return False
+
+    track_store.save(store_path)
+    print('Track store saved to {0}'.format(store_path))
+    return True
+
+
+def load_track(track_log, merge_rule='priority', track_priority=None):
+    """
+    Load a gps track log, or memory-map it if it is a compiled track store.
+    A directory or glob pattern of gpx / csv track logs is merged into one track with merge_track_logs(),
+    in file name order unless track_priority names the logs to prefer.
+    """
+    log_paths = get_track_log_paths(track_log)
+    if len(log_paths) != 1:
+        if not log_paths:
+            print('No track logs found in {0}'.format(track_log))
+            return False
+        return merge_track_logs(order_track_log_paths(log_paths, track_priority), merge_rule)
+
+    if is_track_store(log_paths[0]):
+        track_store = TrackStore.load(log_paths[0])
+        print('Loaded Points : {} from track store'.format(len(track_store)))
+        return track_store
+    return load_gps_track_log(log_paths[0])
+
+
+def get_offset_costs(track_store, image_epochs, offsets, image_latitudes=None, image_longitudes=None):
+    """
+    Score candidate camera clock offsets (seconds added to the image times) against the track, lower is better.
+    With image GPS the cost is the median distance in meters between the image GPS and the track position
+    interpolated at the shifted image time. Without, it is the coefficient of variation of the distance between
+    consecutive images along the track, which is lowest when the images line up with a steady capture cadence.
+    Offsets leaving less than OFFSET_MIN_COVERAGE of the images inside the track cost inf.
+    """
+    import numpy as np
+
+    track_epochs = np.asarray(track_store.epochs, dtype=float)
+    image_epochs = np.asarray(image_epochs, dtype=float)
+    offsets = np.asarray(offsets, dtype=float)
+    costs = np.full(len(offsets), np.inf)
+
+    # Interpolate every candidate at once, in batches of about a million points
+    batch_size = max(1, 1000000 // max(len(image_epochs), 1))
+    for start in range(0, len(offsets), batch_size):
+        batch = offsets[start:start + batch_size]
+        times = (image_epochs[np.newaxis, :] + batch[:, np.newaxis]).ravel()
+        latitudes = np.interp(times, track_epochs, track_store.latitudes, left=np.nan, right=np.nan)
+        longitudes = np.interp(times, track_epochs, track_store.longitudes, left=np.nan, right=np.nan)
+        latitudes = latitudes.reshape(len(batch), -1)
+        longitudes = longitudes.reshape(len(batch), -1)
+        coverage = np.mean(~np.isnan(latitudes), axis=1)
+
+        with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            if image_latitudes is not None:
+                distances = haversine_array(longitudes, latitudes, image_longitudes[np.newaxis, :],
+                                            image_latitudes[np.newaxis, :])
+                batch_costs = np.nanmedian(distances, axis=1)
+            else:
+                steps = haversine_array(longitudes[:, 1:], latitudes[:, 1:], longitudes[:, :-1], latitudes[:, :-1])
+                mean_steps = np.nanmean(steps, axis=1)
+                batch_costs = np.where(mean_steps > 0, np.nanstd(steps, axis=1) / mean_steps, np.inf)
+
+        costs[start:start + batch_size] = np.where((coverage >= OFFSET_MIN_COVERAGE) & ~np.isnan(batch_costs),
+                                                   batch_costs, np.inf)
+    return costs
+
+
+def estimate_time_offset(track_store, image_epochs, image_latitudes=None, image_longitudes=None,
+                         max_offset=7200.0, resolution=OFFSET_RESOLUTION):
+    """
+    Search for the camera clock offset in seconds (added to the image times) that best aligns the images with
+    the track, between -max_offset and max_offset. A coarse grid over a sample of the images is followed by
+    finer grids around the best coarse candidates, down to resolution seconds. Without image GPS the coarse
+    grid is no wider than the median time between images.
+    Return the offset and its get_offset_costs() residual, (None, residual) if the best offset does not fit
+    clearly better than the others, (None, nan) for images without GPS taken at a fixed interval, or
+    (None, inf) if no offset fits.
+    """
+    import numpy as np
+
+    image_epochs = np.asarray(image_epochs, dtype=float)
+    if image_latitudes is not None:
+        image_latitudes = np.asarray(image_latitudes, dtype=float)
+        image_longitudes = np.asarray(image_longitudes, dtype=float)
+    if len(image_epochs) < 2 or len(track_store) < 2:
+        return None, math.inf
+    if image_latitudes is None and is_fixed_interval(image_epochs):
+        return None, math.nan
+
+    sample = np.unique(np.linspace(0, len(image_epochs) - 1, min(len(image_epochs), OFFSET_COARSE_SAMPLE)).astype(int))
+    sample_gps = (image_latitudes[sample], image_longitudes[sample]) if image_latitudes is not None else (None, None)
+
+    # Without image GPS the cost minimum is only about as wide as the time between images
+    step = OFFSET_COARSE_STEP
+    if image_latitudes is None:
+        intervals = np.diff(np.sort(image_epochs))
+        intervals = intervals[intervals > 0]
+        if len(intervals):
+            step = min(step, max(float(np.median(intervals)), resolution))
+    step = min(step, max_offset) if max_offset > 0 else resolution
+    offsets = np.arange(-max_offset, max_offset + step / 2, step)
+    costs = get_offset_costs(track_store, image_epochs[sample], offsets, *sample_gps)
+    order = np.argsort(costs, kind='stable')[:OFFSET_REFINED_CANDIDATES]
+    candidates = offsets[order][np.isfinite(costs[order])]
+
+    best_offset, best_cost = None, math.inf
+    for offset in candidates:
+        candidate_step = step
+        while candidate_step > resolution:
+            fine_step = max(candidate_step / 10, resolution)
+            fine_offsets = offset + np.arange(-candidate_step, candidate_step + fine_step / 2, fine_step)
+            fine_costs = get_offset_costs(track_store, image_epochs[sample], fine_offsets, *sample_gps)
+            offset = fine_offsets[np.argmin(fine_costs)]
+            candidate_step = fine_step
+
+        cost = get_offset_costs(track_store, image_epochs, [offset], image_latitudes, image_longitudes)[0]
+        if cost < best_cost:
+            best_offset, best_cost = float(offset), float(cost)
+
+    # A flat cost curve has a minimum too, only trust one that stands apart from the typical offset
+    if best_offset is not None and best_cost > OFFSET_MAX_CONTRAST * np.median(costs[np.isfinite(costs)]):
+        return None, best_cost
+    return best_offset, best_cost
+
+
+def is_fixed_interval(image_epochs):
+    """
+    Check images were taken at a fixed interval, like a timelapse. The distance travelled between them then
+    follows the speed, and their times have no cadence to line up with a track.
+    """
+    import numpy as np
+
+    intervals = np.diff(np.sort(np.asarray(image_epochs, dtype=float)))
+    return len(intervals) < 2 or np.std(intervals) <= OFFSET_MIN_INTERVAL_VARIATION * np.mean(intervals)
+
+
+def estimate_image_time_offset(list_of_metadata, track_logs, max_offset):
+    """
+    Estimate the camera clock offset of the images against the track log and report it.
+    Images with GPS are matched by position, otherwise by capture cadence.
+    """
+    import numpy as np
+
+    track_store = track_logs if isinstance(track_logs, TrackStore) else TrackStore.from_track_logs(track_logs)
+    image_epochs = np.array([get_epoch_seconds(metadata['ORIGINAL_DATETIME']) for metadata in list_of_metadata])
+    image_gps = np.array([
+        [get_float(metadata['METADATA'].get(key)) for key in ['Composite:GPSLatitude', 'Composite:GPSLongitude']]
+        for metadata in list_of_metadata
+    ], dtype=float).reshape(-1, 2)
+    image_latitudes, image_longitudes = image_gps[:, 0], image_gps[:, 1]
+
+    with_gps = ~np.isnan(image_epochs) & ~np.isnan(image_latitudes) & ~np.isnan(image_longitudes)
+    if np.count_nonzero(with_gps) >= 2:
+        offset, residual = estimate_time_offset(track_store, image_epochs[with_gps], image_latitudes[with_gps],
+                                                image_longitudes[with_gps], max_offset)
+        residual_name = 'median distance to image GPS (m)'
+    else:
+        offset, residual = estimate_time_offset(track_store, image_epochs[~np.isnan(image_epochs)],
+                                                max_offset=max_offset)
+        residual_name = 'capture cadence coefficient of variation'
+
+    if offset is None and math.isnan(residual):
+        print('No reliable camera clock offset: the images have no GPS and were taken at a fixed interval, '
+              'so there is no capture cadence to line up with the track log. Keeping the camera times')
+        return 0
+    if offset is None and math.isinf(residual):
+        print('No camera clock offset within {0} seconds aligns the images with the track log'.format(max_offset))
+        return 0
+    if offset is None:
+        print('No reliable camera clock offset: no offset within {0} seconds fits clearly better than the others '
+              '({1}: {2:.3f}). Keeping the camera times'.format(max_offset, residual_name, residual))
+        return 0
+    print('Camera clock offset: {0:+.1f} seconds ({1}: {2:.3f})'.format(offset, residual_name, residual))
+    return offset
+
+
+def get_float(value):
+    """
+    Return value as a float, or nan if it is not a number.
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def get_geo_data_from_log(df_row, track_logs, time_offset=0):
     """
     Find match geo data from log
+    The image time is shifted by time_offset seconds, rounded to the one second resolution of the logs.
     """
     if track_logs:
-        current_track = track_logs.get(df_row['ORIGINAL_DATETIME'])
+        date_time = df_row['ORIGINAL_DATETIME']
+        if time_offset:
+            date_time = (datetime.datetime.strptime(date_time, '%Y:%m:%d %H:%M:%S') +
+                         datetime.timedelta(seconds=round(time_offset))).strftime('%Y:%m:%d %H:%M:%S')
+        current_track = track_logs.get(date_time)
         if current_track:
             altitude = current_track.get('Altitude')
             result = {
@@ -205,8 +881,9 @@ def get_geo_data_from_log(df_row, track_logs):
             print("Image Original Date time is {0} and the Log time is {1}".format(
                 df_row['ORIGINAL_DATETIME'], result['GPS_DATETIME'].strftime("%Y:%m:%d %H:%M:%S")))
         else:
+            # The shifted image time, so unmatched images share the clock of their matched neighbours
             result = {
-                'GPS_DATETIME': datetime.datetime.strptime(df_row['ORIGINAL_DATETIME'], '%Y:%m:%d %H:%M:%S'),
+                'GPS_DATETIME': datetime.datetime.strptime(date_time, '%Y:%m:%d %H:%M:%S'),
                 'Latitude': df_row['METADATA'].get('Composite:GPSLatitude'),
                 'Longitude': df_row['METADATA'].get('Composite:GPSLongitude'),
                 'Altitude': df_row['METADATA'].get('Composite:GPSAltitude')
@@ -223,6 +900,204 @@ def get_geo_data_from_log(df_row, track_logs):
     return result
 
 
+class DemTiles(object):
+    """
+    Digital elevation model tiles in a directory tree, sampled with bilinear interpolation.
+    SRTM .hgt tiles are found by the one degree cell their name starts with (e.g. N51W001.hgt), GeoTIFF tiles
+    by their bounds. Tile data is memory-mapped when it is first sampled and kept in a least recently used cache.
+    """
+
+    def __init__(self, directory, cache_size=DEM_CACHE_SIZE):
+        import re
+        import collections
+
+        self.directory = directory
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+        self.hgt_tiles = {}
+        self.geotiff_tiles = []
+
+        geotiff_paths = []
+        for path in sorted(get_files(directory)):
+            extension = os.path.splitext(path)[1].lower()
+            match = re.match(r'([NS])(\d{2})([EW])(\d{3})', ntpath.basename(path).upper())
+            if extension == '.hgt' and match:
+                size = int(round(math.sqrt(os.path.getsize(path) / 2)))
+                if size * size * 2 != os.path.getsize(path):
+                    print('Skipping DEM tile {0}: it is not a square grid of 16 bit values'.format(path))
+                    continue
+                south = int(match.group(2)) * (1 if match.group(1) == 'N' else -1)
+                west = int(match.group(4)) * (1 if match.group(3) == 'E' else -1)
+                self.hgt_tiles[(south, west)] = {
+                    'path': path, 'north': south + 1, 'west': west, 'rows': size, 'cols': size,
+                    'lat_step': 1 / (size - 1), 'lon_step': 1 / (size - 1), 'nodata': HGT_VOID
+                }
+            elif extension in ['.tif', '.tiff']:
+                geotiff_paths.append(path)
+
+        if geotiff_paths:
+            try:
+                import tifffile
+            except ImportError:
+                print('tifffile is not installed, skipping {0} GeoTIFF DEM tile(s)'.format(len(geotiff_paths)))
+            else:
+                for path in geotiff_paths:
+                    tile = self.read_geotiff_tile(tifffile, path)
+                    if tile:
+                        self.geotiff_tiles.append(tile)
+
+        if not self.hgt_tiles and not self.geotiff_tiles:
+            raise GeotaggerError('No DEM tiles (.hgt or GeoTIFF) were found in {0}'.format(directory))
+
+    def __len__(self):
+        return len(self.hgt_tiles) + len(self.geotiff_tiles)
+
+    @staticmethod
+    def read_geotiff_tile(tifffile, path):
+        """
+        Return the grid of a single band GeoTIFF from its tags, or None if it is not georeferenced.
+        """
+        with tifffile.TiffFile(path) as tif:
+            page = tif.pages[0]
+            tags = {tag.name: tag.value for tag in page.tags.values()}
+            if 'ModelPixelScaleTag' not in tags or 'ModelTiepointTag' not in tags or len(page.shape) != 2:
+                print('Skipping DEM tile {0}: it is not a georeferenced single band GeoTIFF'.format(path))
+                return None
+
+            lon_step, lat_step = tags['ModelPixelScaleTag'][:2]
+            column, row, _, lon, lat = tags['ModelTiepointTag'][:5]
+            west, north = lon - column * lon_step, lat + row * lat_step
+
+            # GTRasterTypeGeoKey: values are for the area of a pixel (1, the default) or its top left corner (2)
+            geo_keys = tags.get('GeoKeyDirectoryTag', (1, 1, 0, 0))
+            raster_types = [geo_keys[index + 3] for index in range(4, len(geo_keys) - 3, 4) if geo_keys[index] == 1025]
+            if not raster_types or raster_types[0] != 2:
+                west, north = west + lon_step / 2, north - lat_step / 2
+
+            nodata = tags.get('GDAL_NODATA')
+            return {
+                'path': path, 'north': north, 'west': west, 'rows': page.shape[0], 'cols': page.shape[1],
+                'lat_step': lat_step, 'lon_step': lon_step,
+                'nodata': float(nodata.strip('\x00 ')) if nodata else None
+            }
+
+    def get_data(self, tile):
+        """
+        Return the memory-mapped values of a tile, compressed GeoTIFFs are read into memory.
+        """
+        import numpy as np
+
+        path = tile['path']
+        if path in self.cache:
+            self.cache.move_to_end(path)
+            return self.cache[path]
+
+        if path.lower().endswith('.hgt'):
+            data = np.memmap(path, dtype='>i2', mode='r', shape=(tile['rows'], tile['cols']))
+        else:
+            import tifffile
+            try:
+                data = tifffile.memmap(path, mode='r')
+            except ValueError:
+                data = tifffile.imread(path)
+
+        self.cache[path] = data
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return data
+
+    def interpolate(self, tile, latitudes, longitudes):
+        """
+        Bilinear interpolation of a tile at points inside it, nan where a surrounding value is void.
+        """
+        import numpy as np
+
+        data = self.get_data(tile)
+        rows = (tile['north'] - latitudes) / tile['lat_step']
+        cols = (longitudes - tile['west']) / tile['lon_step']
+        row = np.clip(np.floor(rows).astype(int), 0, tile['rows'] - 2)
+        col = np.clip(np.floor(cols).astype(int), 0, tile['cols'] - 2)
+        row_fraction = np.clip(rows - row, 0, 1)
+        col_fraction = np.clip(cols - col, 0, 1)
+
+        corners = np.stack([data[row, col], data[row, col + 1], data[row + 1, col], data[row + 1, col + 1]])
+        corners = corners.astype(float)
+        if tile['nodata'] is not None:
+            corners[corners == tile['nodata']] = np.nan
+
+        top = corners[0] * (1 - col_fraction) + corners[1] * col_fraction
+        bottom = corners[2] * (1 - col_fraction) + corners[3] * col_fraction
+        return top * (1 - row_fraction) + bottom * row_fraction
+
+    def sample(self, latitudes, longitudes):
+        """
+        Return the altitudes at arrays of points, nan outside the tiles or where the tiles are void.
+        Points are grouped by tile, so every tile is looked up once per call.
+        """
+        import numpy as np
+
+        latitudes = np.asarray(latitudes, dtype=float)
+        longitudes = np.asarray(longitudes, dtype=float)
+        altitudes = np.full(len(latitudes), np.nan)
+        valid = ~np.isnan(latitudes) & ~np.isnan(longitudes)
+
+        if self.hgt_tiles and valid.any():
+            cells = np.stack([np.floor(latitudes[valid]), np.floor(longitudes[valid])], axis=1).astype(int)
+            unique_cells, inverse = np.unique(cells, axis=0, return_inverse=True)
+            indices = np.flatnonzero(valid)
+            for cell_index, (south, west) in enumerate(unique_cells):
+                tile = self.hgt_tiles.get((int(south), int(west)))
+                if tile:
+                    in_cell = indices[inverse.reshape(-1) == cell_index]
+                    altitudes[in_cell] = self.interpolate(tile, latitudes[in_cell], longitudes[in_cell])
+
+        for tile in self.geotiff_tiles:
+            inside = np.flatnonzero(
+                valid & np.isnan(altitudes) &
+                (latitudes <= tile['north']) & (latitudes >= tile['north'] - (tile['rows'] - 1) * tile['lat_step']) &
+                (longitudes >= tile['west']) & (longitudes <= tile['west'] + (tile['cols'] - 1) * tile['lon_step']))
+            if len(inside):
+                altitudes[inside] = self.interpolate(tile, latitudes[inside], longitudes[inside])
+
+        return altitudes
+
+
+def apply_dem_altitudes(list_of_images, dem_tiles, dem_mode='fill'):
+    """
+    Set the ALTITUDE of the image records from the DEM tiles in one query, in fill mode only for images
+    without an altitude. Return the number of altitudes set.
+    """
+    if dem_mode == 'fill':
+        list_of_images = [image for image in list_of_images if not image['ALTITUDE'] or is_missing(image['ALTITUDE'])]
+    if not list_of_images:
+        return 0
+
+    altitudes = dem_tiles.sample([get_float(image['LATITUDE']) for image in list_of_images],
+                                 [get_float(image['LONGITUDE']) for image in list_of_images])
+    count = 0
+    for image, altitude in zip(list_of_images, altitudes):
+        if not math.isnan(altitude):
+            image['ALTITUDE'] = round(float(altitude), 2)
+            count += 1
+    return count
+
+
+def add_direction_fields(list_of_images, heading=True, pitch=False):
+    """
+    Set the HEADING and / or PITCH of time sorted image records towards the next image, in one pass
+    over the whole sequence. Unknown values are None.
+    """
+    import numpy as np
+
+    headings, pitches = compute_directions([get_float(image['LATITUDE']) for image in list_of_images],
+                                           [get_float(image['LONGITUDE']) for image in list_of_images],
+                                           [get_float(image['ALTITUDE']) for image in list_of_images])
+    for key, values, enabled in [('HEADING', headings, heading), ('PITCH', pitches, pitch)]:
+        if enabled:
+            for image, value in zip(list_of_images, np.round(values, 2).tolist()):
+                image[key] = None if math.isnan(value) else value
+
+
 def generate_new_fields(df_images):
     """
     Add new fields for calculate
@@ -231,8 +1106,8 @@ def generate_new_fields(df_images):
     df_images['LONGITUDE_PREV'] = df_images['LONGITUDE'].shift(1, fill_value=df_images['LONGITUDE'].iloc[0])
     df_images['ALTITUDE_PREV'] = df_images['ALTITUDE'].shift(1, fill_value=df_images['ALTITUDE'].iloc[0])
 
-    df_images['DISTANCE'] = df_images.apply(
-        lambda x: haversine(x['LONGITUDE'], x['LATITUDE'], x['LONGITUDE_PREV'], x['LATITUDE_PREV']), axis=1)
+    df_images['DISTANCE'] = haversine_array(df_images['LONGITUDE'], df_images['LATITUDE'],
+                                            df_images['LONGITUDE_PREV'], df_images['LATITUDE_PREV'])
     df_images.iat[0, df_images.columns.get_loc('DISTANCE')] = 0
 
     df_images['NEXT_DISTANCE'] = df_images['DISTANCE'].shift(-1, fill_value=0)
@@ -251,6 +1126,8 @@ def discard_track_logs(df_images, discard_distance):
 
 
 def get_middle_point(df_row, normalise_distance):
+    import pandas as pd
+
     if df_row['DISTANCE'] > normalise_distance and df_row['NEXT_DISTANCE'] > normalise_distance:
         res = [
             (df_row[('{}_next'.format(key)).upper()] + df_row[('{}_prev'.format(key)).upper()]) / 2
@@ -283,151 +1160,1631 @@ def normalise_track_logs(df_images, normalise_distance):
     return df_images
 
 
-def geo_tagger(args):
-    path = Path(__file__)
-    input_photo_directory = os.path.abspath(args.input_path)
-    log_path = os.path.abspath(args.track_log) if args.track_log else None
-    output_photo_directory = os.path.abspath(args.output_directory)
-    mode = args.mode.lower()
-    discard = int(args.discard)
-    normalise = int(args.normalise)
+def generate_motion_fields(df_images):
+    """
+    Add time delta, speed and acceleration fields from GPS_DATETIME and the distance fields.
+    Images without a GPS_DATETIME (no track log) use their ORIGINAL_DATETIME.
+    """
+    import numpy as np
+    import pandas as pd
 
-    is_win_shell = True
+    df_images = generate_new_fields(df_images)
 
-    # Validate input paths
-    if not os.path.isdir(input_photo_directory):
-        if os.path.isdir(os.path.join(path.parent.resolve(), input_photo_directory)):
-            input_photo_directory = os.path.join(path.parent.resolve(), input_photo_directory)
-            if not os.path.isdir(output_photo_directory):
-                output_photo_directory = os.path.join(path.parent.resolve(), output_photo_directory)
-        else:
-            input('No valid input folder is given!\nInput folder {0} or {1} does not exist!'.format(
-                os.path.abspath(input_photo_directory),
-                os.path.abspath(os.path.join(path.parent.resolve(), input_photo_directory))))
-            input('Press any key to continue')
-            quit()
+    if pd.api.types.is_datetime64_any_dtype(df_images['GPS_DATETIME']):
+        gps_datetime = df_images['GPS_DATETIME']
+        if gps_datetime.dt.tz is not None:
+            gps_datetime = gps_datetime.dt.tz_localize(None)
+        epochs = gps_datetime.to_numpy(dtype='datetime64[us]').astype('int64') / 1000000
+        epochs[gps_datetime.isna().to_numpy()] = np.nan
+    else:
+        epochs = [
+            get_epoch_seconds(gps_datetime if gps_datetime else original_datetime)
+            for gps_datetime, original_datetime in zip(df_images['GPS_DATETIME'], df_images['ORIGINAL_DATETIME'])
+        ]
+    time_delta, speed, acceleration = compute_motion(epochs, df_images['DISTANCE'])
+    df_images['TIME_DELTA'] = time_delta
+    df_images['SPEED'] = speed
+    df_images['ACCELERATION'] = acceleration
 
-    print('The following input folder will be used:\n{0}'.format(input_photo_directory))
-    print('The following output folder will be used:\n{0}'.format(output_photo_directory))
+    df_images['NEXT_SPEED'] = df_images['SPEED'].shift(-1, fill_value=0)
+    return df_images
 
-    # Often the exiftool.exe will not be in Windows's PATH
-    if args.executable_path == 'No path specified':
-        if 'win' in sys.platform and not 'darwin' in sys.platform:
-            if os.path.isfile(os.path.join(path.parent.resolve(), 'exiftool.exe')):
-                exiftool.executable = os.path.join(path.parent.resolve(), 'exiftool.exe')
-            else:
-                input("""Executing this script on Windows requires either the "-e" option
-                        or store the exiftool.exe file in the working directory.\n\nPress any key to quit...""")
-                quit()
+
+def speed_discard_track_logs(df_images, max_speed):
+    """
+    Discard images whose implied speed from the previous image and to the next image
+    are both more than max_speed (m/s). Images without a usable time are kept.
+    """
+    df_images = generate_motion_fields(df_images)
+
+    df_filtered_images = df_images[~((df_images['SPEED'] > max_speed) & (df_images['NEXT_SPEED'] > max_speed))]
+
+    return df_filtered_images
+
+
+def smooth_track_logs(df_images, window):
+    """
+    Smooth images geo position with a centred rolling median over window images.
+    """
+    import numpy as np
+    import pandas as pd
+
+    df_images = df_images.copy()
+    for key in ['LATITUDE', 'LONGITUDE', 'ALTITUDE']:
+        values = pd.to_numeric(df_images[key], errors='coerce').to_numpy(dtype=float)
+        smoothed = rolling_median(values, window)
+        if np.isnan(smoothed).any():
+            df_images[key] = pd.Series(smoothed, index=df_images.index, dtype=object).where(~np.isnan(smoothed), None)
         else:
-            is_win_shell = False
+            df_images[key] = smoothed
 
-    else:
-        exiftool.executable = args.executable_path
+    return df_images
 
-    # Get files in directory
-    list_of_files = get_files(input_photo_directory)
-    print('{0} file(s) have been found in input directory'.format(len(list_of_files)))
 
-    # Get metadata of each file in list_of_images
-    print('Fetching metadata from all images....\n')
-    with exiftool.ExifTool(win_shell=is_win_shell) as et:
-        list_of_metadata = [{'IMAGE_NAME': image, 'METADATA': et.get_metadata(image)} for image in list_of_files]
+def get_record_distances(list_of_images):
+    """
+    Distance in meters from each image to the previous one, the first image gets 0.
+    """
+    return [0] + [
+        haversine(image['LONGITUDE'], image['LATITUDE'], previous_image['LONGITUDE'], previous_image['LATITUDE'])
+        for previous_image, image in zip(list_of_images, list_of_images[1:])
+    ]
 
-    # filter the images based on mode setting.
-    if mode == 'missing':
-        keys = ['Composite:GPSDateTime', 'Composite:GPSLatitude', 'Composite:GPSLongitude', 'Composite:GPSAltitude',
-                'EXIF:GPSDateStamp', 'EXIF:GPSTimeStamp']
-        list_of_metadata = [metadata for metadata in list_of_metadata if filter_metadata(metadata, keys)]
 
-        if len(list_of_metadata) == 0:
-            input("""There isn't any missing tag file for geotagging.\n\nPress any key to quit...""")
-            quit()
+def discard_records(list_of_images, discard_distance):
+    """
+    Same as discard_track_logs() for a list of image records
+    """
+    distances = get_record_distances(list_of_images)
+    next_distances = distances[1:] + [0]
 
-    # Create dataframe from list_of_metadata with image name in column and metadata in other column
-    df_images = pd.DataFrame(list_of_metadata)
-    keys = ['EXIF:DateTimeOriginal']
-    df_images[['ORIGINAL_DATETIME']] = df_images.apply(
-        lambda x: parse_metadata(x, keys), axis=1, result_type='expand')
+    return [
+        image for image, distance, next_distance in zip(list_of_images, distances, next_distances)
+        if distance <= discard_distance or next_distance <= discard_distance
+    ]
 
-    # Sort images
-    df_images.sort_values('ORIGINAL_DATETIME', axis=0, ascending=True, inplace=True)
-    df_images = df_images.reset_index(drop=True)
 
-    track_logs = {}
-    if log_path:
-        # Work with the resulting image dataframe to filter by time discard or normalise
-        track_logs = load_gps_track_log(log_path)
+def normalise_records(list_of_images, normalise_distance):
+    """
+    Same as normalise_track_logs() for a list of image records
+    """
+    distances = get_record_distances(list_of_images)
+    next_distances = distances[1:] + [0]
+
+    normalised_images = []
+    for i, image in enumerate(list_of_images):
+        image = dict(image)
+        if distances[i] > normalise_distance and next_distances[i] > normalise_distance:
+            previous_image, next_image = list_of_images[i - 1], list_of_images[i + 1]
+            for key in ['LATITUDE', 'LONGITUDE']:
+                image[key] = (next_image[key] + previous_image[key]) / 2
+            if previous_image['ALTITUDE'] and next_image['ALTITUDE']:
+                image['ALTITUDE'] = (next_image['ALTITUDE'] + previous_image['ALTITUDE']) / 2
+            else:
+                image['ALTITUDE'] = None
+        normalised_images.append(image)
 
-    if not track_logs:
-        print("""Track Logs are empty. So using geo values from image.""")
+    return normalised_images
 
-    df_images[['GPS_DATETIME', 'LATITUDE', 'LONGITUDE', 'ALTITUDE']] = \
-        df_images.apply(lambda x: get_geo_data_from_log(x, track_logs), axis=1, result_type='expand')
 
-    df_images = df_images.query('LATITUDE.notnull() or LONGITUDE.notnull()', engine='python')
+def filter_images(list_of_images, discard=0, normalise=0, max_speed=0, smooth=0):
+    """
+    Apply the discard, normalise, max speed or smooth stage to a time sorted list of image records.
+    """
+    if len(list_of_images) <= FAST_PATH_MAX_IMAGES and not max_speed > 0 and not smooth > 1:
+        # Small jobs are filtered as plain records, without loading pandas
+        if discard > 0:
+            list_of_images = discard_records(list_of_images, discard)
+        elif normalise > 0:
+            list_of_images = normalise_records(list_of_images, normalise)
+        return list_of_images
 
-    if not track_logs and len(df_images.index) == 0:
-        input("""Latitude and longitude of all images are empty.\n\nPress any key to quit...""")
-        quit()
+    if not list_of_images or not (discard > 0 or normalise > 0 or max_speed > 0 or smooth > 1):
+        return list_of_images
+
+    import pandas as pd
+
+    # Create dataframe from list_of_images with image name in column and metadata in other column
+    df_images = pd.DataFrame(list_of_images)
 
     if discard > 0:
         df_images = discard_track_logs(df_images, discard)
-        if len(df_images) == 0:
-            input("""All images has been discarded.\n\nPress any key to quit...""")
-            quit()
 
     elif normalise > 0:
         df_images = normalise_track_logs(df_images, normalise)
 
-    # For each image, write the GEO TAGS into EXIF
-    print('Writing metadata to EXIF of qualified images...\n')
-    with exiftool.ExifTool(win_shell=is_win_shell) as et:
-        for row in df_images.iterrows():
-            if row[1]['GPS_DATETIME']:
-                et.execute(bytes('-GPSTimeStamp={0}'.format(row[1]['GPS_DATETIME'].strftime("%H:%M:%S")), 'utf-8'),
-                           bytes("{0}".format(row[1]['IMAGE_NAME']), 'utf-8'))
-                et.execute(bytes('-GPSDateStamp={0}'.format(row[1]['GPS_DATETIME'].strftime("%Y:%m:%d")), 'utf-8'),
-                           bytes("{0}".format(row[1]['IMAGE_NAME']), 'utf-8'))
+    elif max_speed > 0:
+        df_images = speed_discard_track_logs(df_images, max_speed)
 
-            et.execute(bytes('-GPSLatitude={0}'.format(row[1]['LATITUDE']), 'utf-8'),
-                       bytes("{0}".format(row[1]['IMAGE_NAME']), 'utf-8'))
+    elif smooth > 1:
+        df_images = smooth_track_logs(df_images, smooth)
 
-            latitude_ref = 'N' if row[1]['LATITUDE'] > 0 else 'S'
-            et.execute(bytes('-GPSLatitudeRef={0}'.format(latitude_ref), 'utf-8'),
-                       bytes("{0}".format(row[1]['IMAGE_NAME']), 'utf-8'))
+    return df_images.to_dict('records')
 
-            et.execute(bytes('-GPSLongitude={0}'.format(row[1]['LONGITUDE']), 'utf-8'),
-                       bytes("{0}".format(row[1]['IMAGE_NAME']), 'utf-8'))
 
-            longitude_ref = 'E' if row[1]['LONGITUDE'] > 0 else 'W'
-            et.execute(bytes('-GPSLongitudeRef={0}'.format(longitude_ref), 'utf-8'),
-                       bytes("{0}".format(row[1]['IMAGE_NAME']), 'utf-8'))
+def get_filter_halo(smooth=0):
+    """
+    Number of neighbours on each side that the filter_images() result of an image depends on.
+    """
+    return max(smooth // 2, 1)
 
-            if row[1]['ALTITUDE']:
-                altitude_ref = '0' if row[1]['ALTITUDE'] > 0 else '1'
-                et.execute(bytes('-GPSAltitude={0}'.format(row[1]['ALTITUDE']), 'utf-8'),
-                           bytes("{0}".format(row[1]['IMAGE_NAME']), 'utf-8'))
-                et.execute(bytes('-GPSAltitudeRef={0}'.format(altitude_ref), 'utf-8'),
-                           bytes("{0}".format(row[1]['IMAGE_NAME']), 'utf-8'))
 
-    clean_up_new_files(output_photo_directory, [image for image in df_images['IMAGE_NAME'].values])
+def get_gps_tags(image):
+    """
+    Return the (tag, value) pairs to write to an image from its planned geo data.
+    """
+    tags = []
+    if image['GPS_DATETIME'] and not is_missing(image['GPS_DATETIME']):
+        tags.append(('GPSTimeStamp', image['GPS_DATETIME'].strftime("%H:%M:%S")))
+        tags.append(('GPSDateStamp', image['GPS_DATETIME'].strftime("%Y:%m:%d")))
 
-    input('\nMetadata successfully added to images.\n\nPress any key to quit')
-    quit()
+    # Values are written as floats, whether the filter stage kept them as ints or not
+    tags.append(('GPSLatitude', float(image['LATITUDE'])))
+    tags.append(('GPSLatitudeRef', 'N' if image['LATITUDE'] > 0 else 'S'))
+    tags.append(('GPSLongitude', float(image['LONGITUDE'])))
+    tags.append(('GPSLongitudeRef', 'E' if image['LONGITUDE'] > 0 else 'W'))
 
+    if image['ALTITUDE'] and not is_missing(image['ALTITUDE']):
+        tags.append(('GPSAltitude', float(image['ALTITUDE'])))
+        tags.append(('GPSAltitudeRef', '0' if image['ALTITUDE'] > 0 else '1'))
 
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser(description='Image GeoTagger metadata setter')
+    if not is_missing(image.get('HEADING')):
+        tags.append(('GPSImgDirection', image['HEADING']))
+        tags.append(('GPSImgDirectionRef', 'T'))
+    if not is_missing(image.get('PITCH')):
+        tags.append(('PosePitchDegrees', image['PITCH']))
 
-    parser.add_argument('input_path',
+    return tags
+
+
+def get_tag_params(tags):
+    """
+    exiftool write parameters for (tag, value) pairs.
+    """
+    return [bytes('-{0}={1}'.format(tag, value), 'utf-8') for tag, value in tags]
+
+
+def write_metadata(et, list_of_images):
+    """
+    Write the GPS tags of each image with a single exiftool command per image.
+    """
+    for image in list_of_images:
+        params = get_tag_params(get_gps_tags(image))
+        params.append(bytes("{0}".format(image['IMAGE_NAME']), 'utf-8'))
+        et.execute(*params)
+
+
+def get_sidecar_path(output_photo_directory, image):
+    """
+    Path of the XMP sidecar of an image in the output directory, named like exiftool's %d%f.xmp.
+    """
+    return os.path.splitext(get_output_path(output_photo_directory, image))[0] + '.xmp'
+
+
+def get_xmp_coordinate(value, ref):
+    """
+    Format a decimal degrees coordinate as an XMP GPSCoordinate ("DDD,MM.mmmmmmmmk").
+    """
+    degrees = int(abs(value))
+    return '{0},{1:.8f}{2}'.format(degrees, (abs(value) - degrees) * 60, ref)
+
+
+def get_xmp_sidecar(tags):
+    """
+    Return an XMP sidecar with the (tag, value) pairs of get_gps_tags() as exif namespace properties,
+    and the pitch as a GPano (photo sphere) property.
+    """
+    tags = dict(tags)
+    properties = []
+    if 'GPSDateStamp' in tags:
+        properties.append(('exif:GPSTimeStamp', '{0}T{1}Z'.format(tags['GPSDateStamp'].replace(':', '-'),
+                                                                   tags['GPSTimeStamp'])))
+    properties.append(('exif:GPSLatitude', get_xmp_coordinate(tags['GPSLatitude'], tags['GPSLatitudeRef'])))
+    properties.append(('exif:GPSLongitude', get_xmp_coordinate(tags['GPSLongitude'], tags['GPSLongitudeRef'])))
+    if 'GPSAltitude' in tags:
+        properties.append(('exif:GPSAltitude', '{0}/1000'.format(int(round(abs(tags['GPSAltitude']) * 1000)))))
+        properties.append(('exif:GPSAltitudeRef', tags['GPSAltitudeRef']))
+    if 'GPSImgDirection' in tags:
+        properties.append(('exif:GPSImgDirection', '{0}/100'.format(int(round(tags['GPSImgDirection'] * 100)))))
+        properties.append(('exif:GPSImgDirectionRef', tags['GPSImgDirectionRef']))
+    if 'PosePitchDegrees' in tags:
+        properties.append(('GPano:PosePitchDegrees', tags['PosePitchDegrees']))
+
+    lines = [
+        "<?xpacket begin='\ufeff' id='W5M0MpCehiHzreSzNTczkc9d'?>",
+        "<x:xmpmeta xmlns:x='{0}'>".format(XMP_NAMESPACES['x']),
+        " <rdf:RDF xmlns:rdf='{0}'>".format(XMP_NAMESPACES['rdf']),
+        "  <rdf:Description rdf:about='' xmlns:exif='{0}' xmlns:GPano='{1}'>".format(XMP_NAMESPACES['exif'],
+                                                                                     XMP_NAMESPACES['GPano']),
+    ]
+    lines.extend('   <{0}>{1}</{0}>'.format(tag, value) for tag, value in properties)
+    lines.extend([
+        "  </rdf:Description>",
+        " </rdf:RDF>",
+        "</x:xmpmeta>",
+        "<?xpacket end='w'?>",
+        "",
+    ])
+    return '\n'.join(lines)
+
+
+def read_xmp_sidecar(sidecar_path):
+    """
+    Read the (tag, value) pairs of get_gps_tags() back from an XMP sidecar written by write_sidecars().
+    """
+    import xml.etree.ElementTree
+
+    properties = {}
+    for element in xml.etree.ElementTree.parse(sidecar_path).iter():
+        if element.tag.startswith(tuple('{{{0}}}'.format(XMP_NAMESPACES[prefix]) for prefix in ['exif', 'GPano'])):
+            properties[element.tag.split('}')[-1]] = element.text.strip()
+
+    tags = []
+    if 'GPSTimeStamp' in properties:
+        date_time = datetime.datetime.strptime(properties['GPSTimeStamp'], '%Y-%m-%dT%H:%M:%SZ')
+        tags.append(('GPSTimeStamp', date_time.strftime("%H:%M:%S")))
+        tags.append(('GPSDateStamp', date_time.strftime("%Y:%m:%d")))
+
+    for tag in ['GPSLatitude', 'GPSLongitude']:
+        value, ref = properties[tag][:-1], properties[tag][-1]
+        degrees, minutes = value.split(',')
+        coordinate = int(degrees) + float(minutes) / 60
+        tags.append((tag, -coordinate if ref in 'SW' else coordinate))
+        tags.append(('{0}Ref'.format(tag), ref))
+
+    if 'GPSAltitude' in properties:
+        numerator, denominator = properties['GPSAltitude'].split('/')
+        altitude = int(numerator) / int(denominator)
+        tags.append(('GPSAltitude', -altitude if properties['GPSAltitudeRef'] == '1' else altitude))
+        tags.append(('GPSAltitudeRef', properties['GPSAltitudeRef']))
+
+    if 'GPSImgDirection' in properties:
+        numerator, denominator = properties['GPSImgDirection'].split('/')
+        tags.append(('GPSImgDirection', int(numerator) / int(denominator)))
+        tags.append(('GPSImgDirectionRef', properties['GPSImgDirectionRef']))
+    if 'PosePitchDegrees' in properties:
+        tags.append(('PosePitchDegrees', float(properties['PosePitchDegrees'])))
+
+    return tags
+
+
+def link_image(image, output_path):
+    """
+    Hard link an image into the output directory, or copy it if the directories are on different drives.
+    """
+    if os.path.abspath(image) == os.path.abspath(output_path):
+        return
+    if os.path.exists(output_path):
+        os.remove(output_path)
+    try:
+        os.link(image, output_path)
+    except OSError:
+        shutil.copy2(image, output_path)
+
+
+def write_sidecar(output_photo_directory, image, tags):
+    """
+    Hard link an image into the output directory with an XMP sidecar of its tags, return the sidecar size.
+    """
+    link_image(image, get_output_path(output_photo_directory, image))
+    sidecar = get_xmp_sidecar(tags).encode('utf-8')
+    with open(get_sidecar_path(output_photo_directory, image), 'wb') as fh:
+        fh.write(sidecar)
+    return len(sidecar)
+
+
+def write_sidecars(output_photo_directory, list_of_images):
+    """
+    Write the GPS tags of each image to XMP sidecars next to hard links of the images, in parallel.
+    The images themselves are not rewritten. Return the number of bytes written.
+    """
+    import concurrent.futures
+
+    if not os.path.isdir(output_photo_directory):
+        os.mkdir(output_photo_directory)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=SIDECAR_WORKERS) as executor:
+        sizes = list(executor.map(lambda image: write_sidecar(output_photo_directory, image['IMAGE_NAME'],
+                                                              get_gps_tags(image)), list_of_images))
+
+    print('{0} XMP sidecar(s) saved to {1}'.format(len(sizes), os.path.abspath(output_photo_directory)))
+    return sum(sizes)
+
+
+def embed_sidecars(et, directory):
+    """
+    Write the tags of each XMP sidecar in directory into the image next to it, and return the number of images.
+    exiftool replaces the image with a new file, so hard linked originals are left untouched.
+    """
+    embedded = 0
+    for sidecar_path in sorted(glob.glob(os.path.join(glob.escape(directory), '*.xmp'))):
+        images = [path for path in glob.glob(glob.escape(sidecar_path[:-len('.xmp')]) + '.*')
+                  if not path.lower().endswith('.xmp')]
+        if not images:
+            print('There is no image for sidecar {0}'.format(sidecar_path))
+            continue
+
+        params = get_tag_params(read_xmp_sidecar(sidecar_path))
+        params.extend([b'-overwrite_original', bytes("{0}".format(images[0]), 'utf-8')])
+        et.execute(*params)
+        embedded += 1
+
+    return embedded
+
+
+class FolderWatcher(object):
+    """
+    Report the files added to a directory tree once they have been completely written.
+    Uses inotify when the optional inotify_simple package is installed, and polls the folder otherwise.
+    """
+
+    def __init__(self, path, interval=WATCH_INTERVAL, ignore=()):
+        self.path = path
+        self.interval = interval
+        self.ignore = [os.path.join(os.path.abspath(directory), '') for directory in ignore]
+        self.seen = set()
+        self.pending = {}
+        self.inotify = None
+
+        try:
+            from inotify_simple import INotify, flags
+        except ImportError:
+            print('inotify_simple is not installed, polling {0} every {1} seconds'.format(path, interval))
+        else:
+            self.inotify = INotify()
+            self.flags = flags
+            self.watches = {}
+            for directory, _, _ in os.walk(path):
+                self.add_watch(directory)
+
+    def add_watch(self, directory):
+        flags = self.flags
+        mask = flags.CLOSE_WRITE | flags.MOVED_TO | flags.CREATE
+        self.watches[self.inotify.add_watch(directory, mask)] = directory
+
+    def accept(self, list_of_files):
+        """
+        Return the files not seen before, leaving out the ignored directories and exiftool backups.
+        """
+        new_files = []
+        for image in list_of_files:
+            if image in self.seen or image.endswith('_original') or \
+                    any(os.path.abspath(image).startswith(directory) for directory in self.ignore):
+                continue
+            self.seen.add(image)
+            new_files.append(image)
+        return sorted(new_files)
+
+    def scan(self):
+        """
+        Return the files already in the folder.
+        """
+        return self.accept(get_files(self.path))
+
+    def wait(self):
+        """
+        Wait up to interval seconds and return the files completed in the meantime.
+        """
+        if self.inotify:
+            flags = self.flags
+            list_of_files = []
+            for event in self.inotify.read(timeout=int(self.interval * 1000)):
+                path = os.path.join(self.watches.get(event.wd, self.path), event.name)
+                if event.mask & flags.ISDIR:
+                    if event.mask & (flags.CREATE | flags.MOVED_TO):
+                        for directory, _, _ in os.walk(path):
+                            self.add_watch(directory)
+                        list_of_files.extend(get_files(path))
+                elif event.mask & (flags.CLOSE_WRITE | flags.MOVED_TO):
+                    list_of_files.append(path)
+            return self.accept(list_of_files)
+
+        # A file is complete once its size is the same on two scans in a row
+        time.sleep(self.interval)
+        sizes = {}
+        for image in get_files(self.path):
+            if image not in self.seen:
+                try:
+                    sizes[image] = os.path.getsize(image)
+                except OSError:
+                    pass
+        completed = [image for image, size in sizes.items() if self.pending.get(image) == size]
+        self.pending = {image: size for image, size in sizes.items() if image not in completed}
+        return self.accept(completed)
+
+
+class IncrementalGeoTagger(object):
+    """
+    Keep the time sorted images of a watched folder with the GPS tags written for each of them.
+    New images are geotagged together with the neighbours whose discard, normalise, max speed or smooth
+    result they change, so the work per new image does not grow with the size of the folder.
+    Images are written to the output directory with exiftool -o, leaving the input folder untouched.
+    """
+
+    def __init__(self, et, output_photo_directory, track_logs=None, mode='missing',
+                 discard=0, normalise=0, max_speed=0, smooth=0, output_format='embed', dem_tiles=None, dem_mode='fill',
+                 heading=False, pitch=False):
+        self.et = et
+        self.output_photo_directory = output_photo_directory
+        self.output_format = output_format
+        self.dem_tiles = dem_tiles
+        self.dem_mode = dem_mode
+        self.heading = heading
+        self.pitch = pitch
+        self.track_logs = track_logs
+        self.mode = mode
+        self.filter_options = {'discard': discard, 'normalise': normalise, 'max_speed': max_speed, 'smooth': smooth}
+        self.halo = get_filter_halo(smooth)
+        self.images = []
+        self.keys = []
+        self.plans = {}
+        self.written_tags = {}
+
+        if not os.path.isdir(output_photo_directory):
+            os.mkdir(output_photo_directory)
+
+    def read_image(self, image):
+        """
+        Return the image record with its geo data, or None if the image is not geotagged.
+        """
+        metadata = {'IMAGE_NAME': image, 'METADATA': self.et.get_metadata(image)}
+        if self.mode == 'missing' and not filter_metadata(metadata, MISSING_MODE_KEYS):
+            return None
+        if 'EXIF:DateTimeOriginal' not in metadata['METADATA']:
+            print('Skipping {0}: no DateTimeOriginal'.format(image))
+            return None
+
+        metadata['ORIGINAL_DATETIME'] = metadata['METADATA']['EXIF:DateTimeOriginal']
+        geo_data = get_geo_data_from_log(metadata, self.track_logs)
+        if is_missing(geo_data['Latitude']) and is_missing(geo_data['Longitude']):
+            return None
+        metadata.update({
+            'GPS_DATETIME': geo_data['GPS_DATETIME'],
+            'LATITUDE': geo_data['Latitude'],
+            'LONGITUDE': geo_data['Longitude'],
+            'ALTITUDE': geo_data['Altitude']
+        })
+        return metadata
+
+    def add_images(self, list_of_files):
+        """
+        Geotag new image files. Return the number of images written and removed from the output directory.
+        """
+        new_keys = []
+        for image in list_of_files:
+            metadata = self.read_image(image)
+            if metadata:
+                key = (metadata['ORIGINAL_DATETIME'], metadata['IMAGE_NAME'])
+                index = bisect.bisect(self.keys, key)
+                self.keys.insert(index, key)
+                self.images.insert(index, metadata)
+                new_keys.append(key)
+
+        affected = sorted({
+            index
+            for key in new_keys
+            for index in range(bisect.bisect_left(self.keys, key) - self.halo,
+                               bisect.bisect_left(self.keys, key) + self.halo + 1)
+            if 0 <= index < len(self.images)
+        })
+
+        changed = []
+        runs = get_runs(affected)
+        for start, end in runs:
+            context = self.images[max(start - self.halo, 0):end + self.halo]
+            planned = {image['IMAGE_NAME']: dict(image) for image in filter_images(context, **self.filter_options)}
+            if self.dem_tiles:
+                apply_dem_altitudes(list(planned.values()), self.dem_tiles, self.dem_mode)
+            for image in self.images[start:end]:
+                self.plans[image['IMAGE_NAME']] = planned.get(image['IMAGE_NAME'])
+                changed.append(image['IMAGE_NAME'])
+
+        if self.heading or self.pitch:
+            for start, end in runs:
+                changed.extend(self.update_directions(start, end))
+
+        written = removed = 0
+        for image in dict.fromkeys(changed):
+            plan = self.plans[image]
+            tags = get_gps_tags(plan) if plan else None
+            if tags != self.written_tags.get(image):
+                self.write_image(image, tags)
+                if tags:
+                    written += 1
+                else:
+                    removed += 1
+        return written, removed
+
+    def update_directions(self, start, end):
+        """
+        Recompute the directions of the written images around the images between start and end, whose plans
+        changed. Return the names of the images whose directions were recomputed.
+        """
+        def iter_written(indices):
+            return (self.images[index]['IMAGE_NAME'] for index in indices
+                    if self.plans[self.images[index]['IMAGE_NAME']])
+
+        before = iter_written(range(start - 1, -1, -1))
+        after = iter_written(range(end, len(self.images)))
+        previous, following = next(before, None), next(after, None)
+
+        # The image written before the changed ones now points at a different next image
+        window = list(iter_written(range(start, end)))
+        if previous:
+            window.insert(0, previous)
+            previous = next(before, None)
+        if following:
+            window.append(following)
+            following = next(after, None)
+
+        # Stops take the direction of the nearest known segment, so grow the window until it is bounded
+        # by known segments on both sides
+        while previous and (len(window) < 2 or not self.is_known_segment(window[0], window[1])
+                            or not self.is_known_segment(previous, window[0])):
+            window.insert(0, previous)
+            previous = next(before, None)
+        while following and (len(window) < 2 or not self.is_known_segment(window[-2], window[-1])
+                             or not self.is_known_segment(window[-1], following)):
+            window.append(following)
+            following = next(after, None)
+
+        plans = [dict(self.plans[image]) for image in window]
+        add_direction_fields(plans, self.heading, self.pitch)
+        # The last image of the window keeps its direction unless it is the last image written
+        if following:
+            window, plans = window[:-1], plans[:-1]
+        for image, plan in zip(window, plans):
+            self.plans[image] = plan
+        return window
+
+    def is_known_segment(self, image, next_image):
+        """
+        Check the direction from a written image to the next one is its own, not taken from a neighbouring segment.
+        """
+        plan, next_plan = self.plans[image], self.plans[next_image]
+        distance = haversine_array(get_float(plan['LONGITUDE']), get_float(plan['LATITUDE']),
+                                   get_float(next_plan['LONGITUDE']), get_float(next_plan['LATITUDE']))
+        if not distance > 0:
+            return False
+        return not self.pitch or not (math.isnan(get_float(plan['ALTITUDE']))
+                                      or math.isnan(get_float(next_plan['ALTITUDE'])))
+
+    def write_image(self, image, tags):
+        """
+        Write the tags to the output copy of an image, or remove the copy if the image is discarded.
+        """
+        output_path = get_output_path(self.output_photo_directory, image)
+        for path in [output_path, get_sidecar_path(self.output_photo_directory, image)]:
+            if os.path.exists(path):
+                os.remove(path)
+        if tags and self.output_format == 'sidecar':
+            write_sidecar(self.output_photo_directory, image, tags)
+        elif tags:
+            params = get_tag_params(tags)
+            params.extend([b'-o', bytes(output_path, 'utf-8'), bytes("{0}".format(image), 'utf-8')])
+            self.et.execute(*params)
+        self.written_tags[image] = tags
+
+
+def get_runs(indices):
+    """
+    Split sorted indices into (start, end) ranges of consecutive indices.
+    """
+    runs = []
+    for index in indices:
+        if runs and runs[-1][1] == index:
+            runs[-1][1] = index + 1
+        else:
+            runs.append([index, index + 1])
+    return [tuple(run) for run in runs]
+
+
+def watch_geo_tagger(args, input_photo_directory, output_photo_directory, is_win_shell):
+    """
+    Geotag the images in the input folder, then keep geotagging images as they are added until interrupted.
+    exiftool and the track log stay loaded between images.
+    """
+    track_logs = {}
+    if args.track_log:
+        track_logs = load_track(os.path.abspath(args.track_log), args.track_merge, args.track_priority)
+    if args.auto_offset:
+        print('--auto-offset is not used in watch mode')
+    dem_tiles = None
+    if args.dem_directory:
+        dem_tiles = DemTiles(os.path.abspath(args.dem_directory))
+
+    watcher = FolderWatcher(input_photo_directory, float(args.watch_interval), ignore=[output_photo_directory])
+    print('Watching {0} for new images, press Ctrl+C to stop...\n'.format(input_photo_directory))
+    with exiftool.ExifTool(win_shell=is_win_shell) as et:
+        incremental_geo_tagger = IncrementalGeoTagger(
+            et, output_photo_directory, track_logs, args.mode.lower(), int(args.discard), int(args.normalise),
+            float(args.max_speed), int(args.smooth), args.output_format, dem_tiles, args.dem_mode,
+            args.heading, args.pitch)
+        list_of_files = watcher.scan()
+        try:
+            while True:
+                if list_of_files:
+                    start = time.perf_counter()
+                    written, removed = incremental_geo_tagger.add_images(list_of_files)
+                    print('{0} new file(s): {1} image(s) written, {2} removed in {3:.2f} s'.format(
+                        len(list_of_files), written, removed, time.perf_counter() - start))
+                list_of_files = watcher.wait()
+        except KeyboardInterrupt:
+            print('\nStopped watching {0}'.format(input_photo_directory))
+
+
+def get_photo_directories(args):
+    """
+    Return the absolute input and output directories, input paths may also be relative to the script.
+    """
+    path = Path(__file__)
+    input_photo_directory = os.path.abspath(args.input_path)
+    output_photo_directory = os.path.abspath(args.output_directory)
+
+    # Validate input paths
+    if not os.path.isdir(input_photo_directory):
+        if os.path.isdir(os.path.join(path.parent.resolve(), input_photo_directory)):
+            input_photo_directory = os.path.join(path.parent.resolve(), input_photo_directory)
+            if not os.path.isdir(output_photo_directory):
+                output_photo_directory = os.path.join(path.parent.resolve(), output_photo_directory)
+        else:
+            raise GeotaggerError('No valid input folder is given!\nInput folder {0} or {1} does not exist!'.format(
+                os.path.abspath(input_photo_directory),
+                os.path.abspath(os.path.join(path.parent.resolve(), input_photo_directory))))
+
+    return input_photo_directory, output_photo_directory
+
+
+def configure_exiftool(executable_path):
+    """
+    Set the exiftool executable and return whether it has to be started with a Windows shell.
+    """
+    path = Path(__file__)
+    is_win_shell = True
+
+    # Often the exiftool.exe will not be in Windows's PATH
+    if executable_path == 'No path specified':
+        if 'win' in sys.platform and not 'darwin' in sys.platform:
+            if os.path.isfile(os.path.join(path.parent.resolve(), 'exiftool.exe')):
+                exiftool.executable = os.path.join(path.parent.resolve(), 'exiftool.exe')
+            else:
+                raise GeotaggerError("""Executing this script on Windows requires either the "-e" option
+                        or store the exiftool.exe file in the working directory.""")
+        else:
+            is_win_shell = False
+
+    else:
+        exiftool.executable = executable_path
+
+    return is_win_shell
+
+
+def check_options(args):
+    """
+    Check the filter options can be used together.
+    """
+    if len([value for value in [args.discard, args.normalise, args.max_speed, args.smooth] if value]) > 1:
+        raise GeotaggerError("You can only use one of discard(-d), normalise(-n), max speed(-s) and smooth(--smooth) "
+                             "argument in same time.")
+    if int(args.shards) < 1:
+        raise GeotaggerError('The number of shards must be at least 1.')
+    if args.watch and (int(args.shards) > 1 or args.shard_directory):
+        raise GeotaggerError('Sharding (--shards, --shard-dir) is not used in watch mode.')
+    if args.output_format not in OUTPUT_FORMATS:
+        raise GeotaggerError('Output format must be one of {0}.'.format(', '.join(OUTPUT_FORMATS)))
+    if args.dem_mode not in DEM_MODES:
+        raise GeotaggerError('DEM mode must be one of {0}.'.format(', '.join(DEM_MODES)))
+    if args.dem_directory and not os.path.isdir(args.dem_directory):
+        raise GeotaggerError('DEM folder {0} does not exist!'.format(os.path.abspath(args.dem_directory)))
+
+
+def load_cached_track(track_cache, log_path, merge_rule='priority', track_priority=None):
+    """
+    load_track() through a least recently used cache of loaded tracks, keyed by the track log files,
+    their modification time and size. Without a cache the track is always loaded.
+    """
+    if track_cache is None:
+        return load_track(log_path, merge_rule, track_priority)
+
+    try:
+        key = (tuple((path, os.path.getmtime(path), os.path.getsize(path)) for path in get_track_log_paths(log_path)),
+               merge_rule, track_priority)
+    except OSError:
+        return load_track(log_path, merge_rule, track_priority)
+
+    if key in track_cache:
+        track_cache.move_to_end(key)
+        print('Using cached track log {0}'.format(log_path))
+        return track_cache[key]
+
+    track_cache[key] = load_track(log_path, merge_rule, track_priority)
+    while len(track_cache) > TRACK_CACHE_SIZE:
+        track_cache.popitem(last=False)
+    return track_cache[key]
+
+
+def read_metadata(et, list_of_files, mode='missing'):
+    """
+    Read the metadata of image files and parse their original date time, in missing mode images
+    that already have geotags are left out. The records are in the order of list_of_files.
+    """
+    list_of_metadata = [{'IMAGE_NAME': image, 'METADATA': et.get_metadata(image)} for image in list_of_files]
+
+    # filter the images based on mode setting.
+    if mode == 'missing':
+        list_of_metadata = [metadata for metadata in list_of_metadata if filter_metadata(metadata, MISSING_MODE_KEYS)]
+
+    # Parse the original date time of each image
+    keys = ['EXIF:DateTimeOriginal']
+    for metadata in list_of_metadata:
+        metadata['ORIGINAL_DATETIME'] = parse_metadata(metadata, keys)[0]
+    return list_of_metadata
+
+
+def get_geotagged_images(list_of_metadata, track_logs, time_offset=0):
+    """
+    Add the geo data from the track log, or from the image itself, to each record and return the records
+    that have a position.
+    """
+    list_of_images = []
+    for metadata in list_of_metadata:
+        geo_data = get_geo_data_from_log(metadata, track_logs, time_offset)
+        if not is_missing(geo_data['Latitude']) or not is_missing(geo_data['Longitude']):
+            metadata.update({
+                'GPS_DATETIME': geo_data['GPS_DATETIME'],
+                'LATITUDE': geo_data['Latitude'],
+                'LONGITUDE': geo_data['Longitude'],
+                'ALTITUDE': geo_data['Altitude']
+            })
+            list_of_images.append(metadata)
+    return list_of_images
+
+
+def write_images(et, output_photo_directory, list_of_images, output_format='embed'):
+    """
+    Write the planned geo data of the images to the output directory in the output format.
+    """
+    if output_format == 'sidecar':
+        print('Writing metadata to XMP sidecars of qualified images...\n')
+        write_sidecars(output_photo_directory, list_of_images)
+    else:
+        # For each image, write the GEO TAGS into EXIF
+        print('Writing metadata to EXIF of qualified images...\n')
+        write_metadata(et, list_of_images)
+
+        clean_up_new_files(output_photo_directory, [image['IMAGE_NAME'] for image in list_of_images])
+
+
+def get_shard_ranges(count, shards):
+    """
+    Split count items into at most shards contiguous (start, end) ranges whose sizes differ by at most one.
+    """
+    shards = max(min(shards, count), 1)
+    bounds = [count * shard // shards for shard in range(shards + 1)]
+    return list(zip(bounds, bounds[1:]))
+
+
+def get_read_shard_tasks(list_of_files, shards, mode):
+    """
+    Tasks reading the metadata of contiguous parts of the image files.
+    """
+    return [
+        {'phase': 'read', 'files': list_of_files[start:end], 'mode': mode}
+        for start, end in get_shard_ranges(len(list_of_files), shards)
+    ]
+
+
+def get_plan_shard_tasks(list_of_images, shards, filter_options):
+    """
+    Tasks planning contiguous time partitions of the time sorted images. Each partition comes with the halo
+    of neighbours on both sides that the filter result of its images depends on, so its images are planned
+    exactly as in a single partition.
+    """
+    halo = get_filter_halo(filter_options['smooth'])
+    tasks = []
+    for start, end in get_shard_ranges(len(list_of_images), shards):
+        context_start = max(start - halo, 0)
+        tasks.append({
+            'phase': 'plan',
+            'images': [{key: image[key] for key in SHARD_IMAGE_KEYS}
+                       for image in list_of_images[context_start:end + halo]],
+            'partition': [start - context_start, end - context_start],
+            'filter': filter_options
+        })
+    return tasks
+
+
+def get_write_shard_tasks(list_of_plans, output_photo_directory, output_format):
+    """
+    Tasks writing the planned images of each partition.
+    """
+    return [
+        {'phase': 'write', 'images': plan, 'output_directory': output_photo_directory, 'output_format': output_format}
+        for plan in list_of_plans if plan
+    ]
+
+
+def run_shard_task(task, et=None):
+    """
+    Run a task of a sharded run with et, by default the warm exiftool of a worker process.
+    A read task returns the metadata records of its files, a plan task the planned images of its partition
+    and a write task the number of images written.
+    """
+    et = et or _worker_exiftool
+    if task['phase'] == 'read':
+        list_of_metadata = read_metadata(et, task['files'], task['mode'])
+        for metadata in list_of_metadata:
+            metadata['METADATA'] = {key: value for key, value in metadata['METADATA'].items()
+                                    if key in SHARD_METADATA_KEYS}
+        return list_of_metadata
+
+    if task['phase'] == 'plan':
+        start, end = task['partition']
+        planned = {image['IMAGE_NAME']: image for image in filter_images(task['images'], **task['filter'])}
+        return [
+            {key: planned[image['IMAGE_NAME']][key] for key in SHARD_IMAGE_KEYS}
+            for image in task['images'][start:end] if image['IMAGE_NAME'] in planned
+        ]
+
+    write_images(et, task['output_directory'], task['images'], task['output_format'])
+    return len(task['images'])
+
+
+def get_shard_json_value(value):
+    """
+    json default for the values of image records: datetimes, missing values and numpy scalars.
+    """
+    if is_missing(value):
+        return None
+    if isinstance(value, datetime.datetime):
+        utc_offset = value.utcoffset()
+        return {'datetime': value.strftime('%Y-%m-%dT%H:%M:%S.%f'),
+                'utcoffset': utc_offset.total_seconds() if utc_offset is not None else None}
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError('{0} is not JSON serializable'.format(type(value).__name__))
+
+
+def get_shard_json_object(obj):
+    """
+    json object hook that reads back the datetimes written by get_shard_json_value().
+    """
+    if set(obj) != {'datetime', 'utcoffset'}:
+        return obj
+    date_time = datetime.datetime.strptime(obj['datetime'], '%Y-%m-%dT%H:%M:%S.%f')
+    if obj['utcoffset'] is not None:
+        date_time = date_time.replace(tzinfo=datetime.timezone(datetime.timedelta(seconds=obj['utcoffset'])))
+    return date_time
+
+
+def dump_shard_json(value, path):
+    """
+    Write value to path as JSON through a temporary file, so other nodes never read a partial file.
+    """
+    import json
+
+    with open(path + '.tmp', 'w', encoding='utf-8') as fh:
+        json.dump(value, fh, default=get_shard_json_value)
+    os.replace(path + '.tmp', path)
+
+
+def load_shard_json(path):
+    import json
+
+    with open(path, encoding='utf-8') as fh:
+        return json.load(fh, object_hook=get_shard_json_object)
+
+
+def run_shard_directory_task(shard_directory, et, claim_timeout=SHARD_CLAIM_TIMEOUT):
+    """
+    Claim and run one unclaimed task of a shard directory, return False if there was none.
+    A task is claimed by creating its .claim file exclusively, its result is written to its .result.json file.
+    The claim is touched while the task runs, a claim older than claim_timeout seconds is taken over.
+    """
+    import socket
+    import threading
+
+    owner = bytes('{0} {1}'.format(socket.gethostname(), os.getpid()), 'utf-8')
+    for task_path in sorted(glob.glob(os.path.join(glob.escape(shard_directory), '*.task.json'))):
+        name = task_path[:-len('.task.json')]
+        if os.path.exists(name + '.result.json'):
+            continue
+        if not create_shard_claim(name + '.claim', owner, claim_timeout):
+            continue
+
+        stopped = threading.Event()
+
+        def heartbeat():
+            while not stopped.wait(SHARD_HEARTBEAT_INTERVAL):
+                try:
+                    os.utime(name + '.claim')
+                except OSError:
+                    pass
+
+        thread = threading.Thread(target=heartbeat, daemon=True)
+        thread.start()
+        try:
+            result = {'status': 'done', 'result': run_shard_task(load_shard_json(task_path), et)}
+        except GeotaggerError as e:
+            result = {'status': 'failed', 'error': str(e)}
+        except Exception as e:
+            result = {'status': 'failed', 'error': '{0}: {1}'.format(type(e).__name__, e)}
+        finally:
+            stopped.set()
+            thread.join()
+        dump_shard_json(result, name + '.result.json')
+        return True
+    return False
+
+
+def create_shard_claim(claim_path, owner, claim_timeout=SHARD_CLAIM_TIMEOUT):
+    """
+    Create a task claim holding owner exclusively, taking over a claim older than claim_timeout seconds.
+    Return False if the task is claimed by another worker.
+    """
+    try:
+        fd = os.open(claim_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        try:
+            if time.time() - os.stat(claim_path).st_mtime < claim_timeout:
+                return False
+            with open(claim_path, 'rb') as fh:
+                stale_owner = fh.read()
+            # Only one worker can move the stale claim away, the others find it gone
+            stale_path = '{0}.{1}'.format(claim_path, owner.decode('utf-8').replace(' ', '-'))
+            os.rename(claim_path, stale_path)
+        except FileNotFoundError:
+            return False
+        with open(stale_path, 'rb') as fh:
+            moved_owner = fh.read()
+        if moved_owner != stale_owner:
+            # Another worker took the stale claim over in between, give its claim back
+            os.rename(stale_path, claim_path)
+            return False
+        os.remove(stale_path)
+        print('Taking over the stale claim of {0} on {1}'.format(stale_owner.decode('utf-8', 'replace'),
+                                                                 os.path.basename(claim_path)))
+        return create_shard_claim(claim_path, owner, claim_timeout)
+    os.write(fd, owner)
+    os.close(fd)
+    return True
+
+
+class ShardRunner(object):
+    """
+    Run the tasks of a geotagging run one after another with a running exiftool.
+    """
+
+    def __init__(self, et):
+        self.et = et
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def run(self, tasks):
+        """
+        Run tasks and return their results in the order of the tasks.
+        """
+        return [run_shard_task(task, self.et) for task in tasks]
+
+    def close(self):
+        pass
+
+
+class LocalShardRunner(ShardRunner):
+    """
+    Run tasks on worker processes that each keep an exiftool process warm.
+    """
+
+    def __init__(self, et, workers, executable_path='No path specified'):
+        import concurrent.futures
+
+        super().__init__(et)
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, initializer=start_worker, initargs=(executable_path,))
+
+    def run(self, tasks):
+        return list(self.executor.map(run_shard_task, tasks))
+
+    def close(self):
+        self.executor.shutdown()
+
+
+class DirectoryShardRunner(ShardRunner):
+    """
+    Publish tasks as files in a directory on a shared filesystem, where shard-worker processes on any node
+    claim and run them. The coordinator runs tasks with its own exiftool while it waits for their results.
+    """
+
+    def __init__(self, et, shard_directory, interval=SHARD_POLL_INTERVAL):
+        super().__init__(et)
+        if os.path.isdir(shard_directory) and os.listdir(shard_directory):
+            raise GeotaggerError('Shard directory {0} is not empty.'.format(shard_directory))
+        if not os.path.isdir(shard_directory):
+            os.makedirs(shard_directory)
+        self.shard_directory = shard_directory
+        self.interval = interval
+        self.count = 0
+
+    def run(self, tasks):
+        names = []
+        for task in tasks:
+            name = os.path.join(self.shard_directory, '{0:05d}-{1}'.format(self.count, task['phase']))
+            dump_shard_json(task, name + '.task.json')
+            names.append(name)
+            self.count += 1
+
+        results = {}
+        while len(results) < len(names):
+            if not run_shard_directory_task(self.shard_directory, self.et):
+                time.sleep(self.interval)
+            for name in names:
+                if name not in results and os.path.exists(name + '.result.json'):
+                    results[name] = load_shard_json(name + '.result.json')
+
+        for name in names:
+            if results[name]['status'] == 'failed':
+                raise GeotaggerError('Shard task {0} failed: {1}'.format(os.path.basename(name), results[name]['error']))
+        return [results[name]['result'] for name in names]
+
+    def close(self):
+        dump_shard_json({'finished_at': time.time()}, os.path.join(self.shard_directory, SHARD_FINISHED_FILE))
+
+
+def get_shard_runner(et, shards=1, shard_directory=None, executable_path='No path specified'):
+    """
+    Shard runner of a run: tasks are published in shard_directory if it is given, otherwise run on shards
+    local worker processes, or one after another with et if there is a single shard.
+    """
+    if shard_directory:
+        return DirectoryShardRunner(et, os.path.abspath(shard_directory))
+    if shards > 1:
+        return LocalShardRunner(et, shards, executable_path)
+    return ShardRunner(et)
+
+
+def run_geo_tagger(args, et=None, track_cache=None, shard_runner=None):
+    """
+    Geotag the images of args.input_path into args.output_directory without asking the user anything.
+    A running ExifTool and a track cache (collections.OrderedDict) can be passed in to reuse them across jobs.
+    Metadata is read, images planned and written in args.shards time partitions by a shard runner.
+    Raise GeotaggerError if the job can not be completed, otherwise return its metrics.
+    """
+    check_options(args)
+    input_photo_directory, output_photo_directory = get_photo_directories(args)
+    if et is None:
+        is_win_shell = configure_exiftool(args.executable_path)
+        with exiftool.ExifTool(win_shell=is_win_shell) as et:
+            return run_geo_tagger(args, et, track_cache)
+
+    shards = int(args.shards)
+    if shard_runner is None:
+        with get_shard_runner(et, shards, args.shard_directory, args.executable_path) as shard_runner:
+            return run_geo_tagger(args, et, track_cache, shard_runner)
+
+    start = time.perf_counter()
+    log_path = os.path.abspath(args.track_log) if args.track_log else None
+    mode = args.mode.lower()
+    discard = int(args.discard)
+    normalise = int(args.normalise)
+    max_speed = float(args.max_speed)
+    smooth = int(args.smooth)
+    metrics = {'seconds': {}, 'shards': shards}
+
+    print('The following input folder will be used:\n{0}'.format(input_photo_directory))
+    print('The following output folder will be used:\n{0}'.format(output_photo_directory))
+
+    # Get files in directory
+    list_of_files = get_files(input_photo_directory)
+    print('{0} file(s) have been found in input directory'.format(len(list_of_files)))
+    metrics['files'] = len(list_of_files)
+
+    # Get metadata of each file in list_of_images
+    print('Fetching metadata from all images....\n')
+    list_of_metadata = [
+        metadata
+        for shard in shard_runner.run(get_read_shard_tasks(list_of_files, shards, mode))
+        for metadata in shard
+    ]
+    metrics['seconds']['metadata'] = time.perf_counter() - start
+
+    if mode == 'missing' and len(list_of_metadata) == 0:
+        raise GeotaggerError("There isn't any missing tag file for geotagging.")
+    list_of_metadata.sort(key=lambda x: (x['ORIGINAL_DATETIME'], x['IMAGE_NAME']))
+
+    stage_start = time.perf_counter()
+    track_logs = {}
+    if log_path:
+        # Work with the resulting image dataframe to filter by time discard or normalise
+        track_logs = load_cached_track(track_cache, log_path, args.track_merge, args.track_priority)
+
+    if not track_logs:
+        print("""Track Logs are empty. So using geo values from image.""")
+
+    time_offset = 0
+    if args.auto_offset and track_logs:
+        time_offset = estimate_image_time_offset(list_of_metadata, track_logs, float(args.max_offset))
+    metrics['time_offset'] = time_offset
+
+    list_of_images = get_geotagged_images(list_of_metadata, track_logs, time_offset)
+    metrics['seconds']['track'] = time.perf_counter() - stage_start
+    metrics['images'] = len(list_of_images)
+
+    if not track_logs and len(list_of_images) == 0:
+        raise GeotaggerError("Latitude and longitude of all images are empty.")
+
+    stage_start = time.perf_counter()
+    filter_options = {'discard': discard, 'normalise': normalise, 'max_speed': max_speed, 'smooth': smooth}
+    list_of_plans = shard_runner.run(get_plan_shard_tasks(list_of_images, shards, filter_options))
+    list_of_images = [image for plan in list_of_plans for image in plan]
+    metrics['seconds']['filter'] = time.perf_counter() - stage_start
+    metrics['discarded'] = metrics['images'] - len(list_of_images)
+
+    if len(list_of_images) == 0 and (discard > 0 or max_speed > 0):
+        raise GeotaggerError("All images has been discarded.")
+
+    if args.dem_directory:
+        stage_start = time.perf_counter()
+        dem_tiles = DemTiles(os.path.abspath(args.dem_directory))
+        metrics['dem_altitudes'] = apply_dem_altitudes(list_of_images, dem_tiles, args.dem_mode)
+        print('{0} altitude(s) set from {1} DEM tile(s)'.format(metrics['dem_altitudes'], len(dem_tiles)))
+        metrics['seconds']['dem'] = time.perf_counter() - stage_start
+
+    if args.heading or args.pitch:
+        # Directions are written together with the GPS tags, towards the next image that is written
+        stage_start = time.perf_counter()
+        add_direction_fields(list_of_images, args.heading, args.pitch)
+        metrics['seconds']['direction'] = time.perf_counter() - stage_start
+
+    stage_start = time.perf_counter()
+    if not os.path.isdir(output_photo_directory):
+        os.mkdir(output_photo_directory)
+    shard_runner.run(get_write_shard_tasks(list_of_plans, output_photo_directory, args.output_format))
+    metrics['seconds']['write'] = time.perf_counter() - stage_start
+    metrics['written'] = len(list_of_images)
+    metrics['seconds']['total'] = time.perf_counter() - start
+    metrics['images_per_second'] = metrics['written'] / metrics['seconds']['total'] if metrics['written'] else 0
+
+    return metrics
+
+
+def geo_tagger(args):
+    try:
+        if args.watch:
+            check_options(args)
+            input_photo_directory, output_photo_directory = get_photo_directories(args)
+            is_win_shell = configure_exiftool(args.executable_path)
+            watch_geo_tagger(args, input_photo_directory, output_photo_directory, is_win_shell)
+            quit()
+
+        run_geo_tagger(args)
+    except GeotaggerError as e:
+        input('{0}\n\nPress any key to quit...'.format(e))
+        quit()
+
+    input('\nMetadata successfully added to images.\n\nPress any key to quit')
+    quit()
+
+
+def start_worker(executable_path):
+    """
+    Start the warm exiftool process and track cache of a GeotagWorkerPool worker process.
+    """
+    global _worker_exiftool, _worker_track_cache
+
+    import signal
+    import collections
+    import multiprocessing.util
+
+    # Ctrl+C is handled by the parent process, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    is_win_shell = configure_exiftool(executable_path)
+    _worker_exiftool = exiftool.ExifTool(win_shell=is_win_shell)
+    _worker_exiftool.start()
+    multiprocessing.util.Finalize(_worker_exiftool, _worker_exiftool.terminate, exitpriority=10)
+    _worker_track_cache = collections.OrderedDict()
+
+
+def get_job_args(options):
+    """
+    Build the command line arguments of a job from a dict of options named like the argument dest names.
+    The values are checked here rather than parsed by argparse, which exits on a bad value.
+    """
+    if not isinstance(options, dict):
+        raise GeotaggerError('A job must be a JSON object of options.')
+    if not options.get('input_path') or not options.get('output_directory'):
+        raise GeotaggerError('A job needs an input_path and an output_directory.')
+
+    args = get_parser().parse_args(['input_path', 'output_directory'])
+    numbers = {'discard': int, 'normalise': int, 'smooth': int, 'max_speed': float, 'max_offset': float}
+    choices = {'track_merge': TRACK_MERGE_RULES, 'dem_mode': DEM_MODES, 'output_format': OUTPUT_FORMATS}
+    for key, value in options.items():
+        if not hasattr(args, key) or key in ['watch', 'watch_interval', 'shards', 'shard_directory']:
+            raise GeotaggerError('Unknown job option: {0}'.format(key))
+        default = getattr(args, key)
+        if isinstance(default, bool):
+            if not isinstance(value, bool):
+                raise GeotaggerError('Job option {0} must be true or false.'.format(key))
+        elif key in numbers:
+            try:
+                value = numbers[key](str(value))
+            except ValueError:
+                raise GeotaggerError('Job option {0} must be a number, not {1!r}.'.format(key, value))
+        elif not isinstance(value, str) and not (value is None and default is None):
+            raise GeotaggerError('Job option {0} must be a string.'.format(key))
+        if key in choices and value not in choices[key]:
+            raise GeotaggerError('Job option {0} must be one of {1}.'.format(key, ', '.join(choices[key])))
+        setattr(args, key, value)
+    return args
+
+
+def run_geo_tagger_job(options):
+    """
+    Run a job in a GeotagWorkerPool worker process, return its status, metrics and the end of its output.
+    """
+    import io
+    import contextlib
+
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            metrics = run_geo_tagger(get_job_args(options), _worker_exiftool, _worker_track_cache)
+        result = {'status': 'done', 'metrics': metrics}
+    except GeotaggerError as e:
+        result = {'status': 'failed', 'error': str(e)}
+    except Exception as e:
+        result = {'status': 'failed', 'error': '{0}: {1}'.format(type(e).__name__, e)}
+    result['output'] = output.getvalue()[-JOB_OUTPUT_LIMIT:]
+    return result
+
+
+class GeotagWorkerPool(object):
+    """
+    Run geotagging jobs on worker processes that each keep an exiftool process and a track cache warm.
+    At most workers jobs run at the same time, the others wait in a queue in submission order.
+    """
+
+    def __init__(self, workers=None, executable_path='No path specified'):
+        import queue
+        import threading
+        import collections
+        import concurrent.futures
+
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.workers, initializer=start_worker, initargs=(executable_path,))
+        self.jobs = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.threads = [threading.Thread(target=self.dispatch, daemon=True) for _ in range(self.workers)]
+
+        # Start the worker processes, and their exiftool processes, before the first job arrives
+        list(self.executor.map(time.sleep, [0.1] * self.workers))
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, options):
+        """
+        Queue a job and return its status.
+        """
+        import uuid
+
+        job = {'id': uuid.uuid4().hex[:12], 'status': 'queued', 'options': options, 'submitted_at': time.time()}
+        with self.lock:
+            self.jobs[job['id']] = job
+        self.queue.put(job)
+        return self.get(job['id'])
+
+    def dispatch(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            with self.lock:
+                job['status'] = 'running'
+                job['started_at'] = time.time()
+            try:
+                result = self.executor.submit(run_geo_tagger_job, job['options']).result()
+            except Exception as e:
+                result = {'status': 'failed', 'error': '{0}: {1}'.format(type(e).__name__, e)}
+            with self.lock:
+                job.update(result)
+                job['finished_at'] = time.time()
+                job['queued_seconds'] = job['started_at'] - job['submitted_at']
+                job['run_seconds'] = job['finished_at'] - job['started_at']
+
+    def get(self, job_id):
+        """
+        Return a copy of a job status without its output, or None if there is no such job.
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return {key: value for key, value in job.items() if key != 'output'} if job else None
+
+    def get_output(self, job_id):
+        """
+        Return the end of the output of a finished job, or None if there is no such job.
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return {'id': job_id, 'output': job.get('output', '')} if job else None
+
+    def list(self):
+        with self.lock:
+            return [{key: job.get(key) for key in ['id', 'status', 'submitted_at']} for job in self.jobs.values()]
+
+    def shutdown(self, cancel_queued=False):
+        """
+        Stop the pool once the running jobs are done. Queued jobs are run first, or cancelled.
+        """
+        import queue
+
+        while cancel_queued:
+            try:
+                job = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            with self.lock:
+                job['status'] = 'cancelled'
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.executor.shutdown()
+
+
+def serve(pool, host=SERVICE_HOST, port=SERVICE_PORT):
+    """
+    Serve the worker pool over HTTP until interrupted.
+    POST /jobs with a JSON object of job options, sent as application/json and without an Origin header,
+    queues a job. GET /jobs lists the jobs, GET /jobs/<id> returns the status and metrics of one job
+    and GET /jobs/<id>/output the end of its output.
+    """
+    import json
+    import http.server
+
+    class GeotagRequestHandler(http.server.BaseHTTPRequestHandler):
+
+        def send_json(self, status, data):
+            body = json.dumps(data).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            parts = self.path.strip('/').split('/')
+            if parts == ['jobs']:
+                self.send_json(200, pool.list())
+            elif len(parts) == 2 and parts[0] == 'jobs' and pool.get(parts[1]):
+                self.send_json(200, pool.get(parts[1]))
+            elif len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'output' and pool.get(parts[1]):
+                self.send_json(200, pool.get_output(parts[1]))
+            else:
+                self.send_json(404, {'error': 'Not found: {0}'.format(self.path)})
+
+        def do_POST(self):
+            if self.path.strip('/') != 'jobs':
+                self.send_json(404, {'error': 'Not found: {0}'.format(self.path)})
+                return
+            # Web pages can post to localhost without a CORS preflight only with a form content type,
+            # and browsers always send their Origin, so both are refused
+            if self.headers.get('Origin') is not None:
+                self.send_json(403, {'error': 'Requests from web pages are not accepted.'})
+                return
+            if self.headers.get_content_type() != 'application/json':
+                self.send_json(415, {'error': 'Jobs must be posted as application/json.'})
+                return
+            try:
+                options = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                get_job_args(options)
+            except (ValueError, GeotaggerError) as e:
+                self.send_json(400, {'error': str(e)})
+                return
+            self.send_json(202, pool.submit(options))
+
+    server = http.server.ThreadingHTTPServer((host, port), GeotagRequestHandler)
+    print('Geotagging service with {0} worker(s) listening on http://{1}:{2}, press Ctrl+C to stop...'.format(
+        pool.workers, host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print('\nStopping geotagging service...')
+    finally:
+        server.server_close()
+
+
+def service_request(server, method, path, data=None):
+    """
+    Send a request to a geotagging service and return the decoded JSON response.
+    """
+    import json
+    import urllib.error
+    import urllib.request
+
+    request = urllib.request.Request(server.rstrip('/') + path, method=method,
+                                     data=json.dumps(data).encode('utf-8') if data is not None else None,
+                                     headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        raise GeotaggerError(json.loads(e.read() or b'{}').get('error', str(e)))
+    except urllib.error.URLError as e:
+        raise GeotaggerError('Could not reach the geotagging service at {0}: {1}'.format(server, e.reason))
+
+
+def read_batch_manifest(manifest_path):
+    """
+    Read the jobs of a batch manifest: a JSON list of job options, or a CSV file with a column per option.
+    Options are named like the argument dest names (input_path, output_directory, track_log, ...),
+    empty CSV cells are left out and relative paths are relative to the manifest.
+    """
+    if not os.path.isfile(manifest_path):
+        raise GeotaggerError('Batch manifest {0} does not exist!'.format(os.path.abspath(manifest_path)))
+
+    if manifest_path.lower().endswith('.csv'):
+        with open(manifest_path, newline='', encoding='utf-8') as fh:
+            jobs = [{key: value for key, value in row.items() if key and value not in [None, '']}
+                    for row in csv.DictReader(fh)]
+        # Flags are true for 1, true or yes
+        defaults = vars(get_parser().parse_args(['input_path', 'output_directory']))
+        for job in jobs:
+            for key, value in job.items():
+                if isinstance(defaults.get(key), bool):
+                    job[key] = value.strip().lower() in ['1', 'true', 'yes']
+    else:
+        import json
+
+        try:
+            with open(manifest_path, encoding='utf-8') as fh:
+                jobs = json.load(fh)
+        except ValueError as e:
+            raise GeotaggerError('Batch manifest {0} is not valid JSON: {1}'.format(manifest_path, e))
+        if not isinstance(jobs, list) or not all(isinstance(job, dict) for job in jobs):
+            raise GeotaggerError('Batch manifest {0} must be a list of job options.'.format(manifest_path))
+
+    manifest_directory = os.path.dirname(os.path.abspath(manifest_path))
+    for job in jobs:
+        for key in ['input_path', 'output_directory', 'track_log', 'dem_directory']:
+            if job.get(key):
+                job[key] = os.path.join(manifest_directory, job[key])
+    return jobs
+
+
+def run_batch(jobs, workers=None, executable_path='No path specified', interval=0.2):
+    """
+    Run jobs on one GeotagWorkerPool, so they share its warm exiftool processes and track caches.
+    Jobs are queued by image count, largest first, which keeps all workers busy until close to the end.
+    Return the status of the jobs in the order they were given, each with the number of files found.
+    """
+    sizes = [
+        len(get_files(job['input_path'])) if job.get('input_path') and os.path.isdir(job['input_path']) else 0
+        for job in jobs
+    ]
+
+    pool = GeotagWorkerPool(workers, executable_path)
+    job_ids = {}
+    try:
+        for index in sorted(range(len(jobs)), key=lambda index: -sizes[index]):
+            job_ids[index] = pool.submit(jobs[index])['id']
+        while any(pool.get(job_id)['status'] in ['queued', 'running'] for job_id in job_ids.values()):
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print('\nStopping, waiting for the running jobs to finish...')
+        pool.shutdown(cancel_queued=True)
+    else:
+        pool.shutdown()
+
+    results = []
+    for index, job in enumerate(jobs):
+        result = pool.get(job_ids[index]) if index in job_ids else {'status': 'cancelled', 'options': job}
+        result['files'] = sizes[index]
+        results.append(result)
+    return results
+
+
+def get_batch_summary(results, seconds):
+    """
+    Consolidate the status of batch jobs into per job throughput, failures and totals.
+    """
+    summary_jobs = []
+    for result in results:
+        metrics = result.get('metrics') or {}
+        summary_jobs.append({
+            'input_path': result['options'].get('input_path'),
+            'output_directory': result['options'].get('output_directory'),
+            'status': result['status'],
+            'files': result['files'],
+            'images': metrics.get('images', 0),
+            'written': metrics.get('written', 0),
+            'discarded': metrics.get('discarded', 0),
+            'seconds': result.get('run_seconds', 0),
+            'images_per_second': metrics.get('images_per_second', 0),
+            'error': result.get('error'),
+        })
+
+    written = sum(job['written'] for job in summary_jobs)
+    return {
+        'jobs': summary_jobs,
+        'done': len([job for job in summary_jobs if job['status'] == 'done']),
+        'failed': len([job for job in summary_jobs if job['status'] == 'failed']),
+        'cancelled': len([job for job in summary_jobs if job['status'] == 'cancelled']),
+        'written': written,
+        'seconds': seconds,
+        'images_per_second': written / seconds if seconds else 0,
+    }
+
+
+def compile_track_command(argv):
+    parser = argparse.ArgumentParser(prog='image-geotagger.py compile-track',
+                                     description='Compile a GPS track log into a binary track store')
+
+    parser.add_argument('track_log',
+                        action='store',
+                        help='Path to GPS track log file (gpx or csv), or a directory or glob pattern of track logs to merge.')
+
+    parser.add_argument('output_path',
+                        action='store',
+                        nargs='?',
+                        default=None,
+                        help='Path to the track store. Default is the track log path with {0} appended.'.format(
+                            TRACK_STORE_EXTENSION))
+
+    parser.add_argument('--track-merge',
+                        action='store',
+                        dest='track_merge',
+                        default='priority',
+                        choices=TRACK_MERGE_RULES,
+                        help='How to choose between track logs with a point at the same time.')
+
+    parser.add_argument('--track-priority',
+                        action='store',
+                        dest='track_priority',
+                        default=None,
+                        help='Comma separated track log file names, highest priority first.')
+
+    compile_args = parser.parse_args(argv)
+    log_path = os.path.abspath(compile_args.track_log)
+    if not compile_args.output_path and glob.has_magic(log_path):
+        parser.error('an output path is required when the track log is a glob pattern')
+    store_path = os.path.abspath(compile_args.output_path or log_path.rstrip(os.sep) + TRACK_STORE_EXTENSION)
+
+    if not compile_track(log_path, store_path, compile_args.track_merge, compile_args.track_priority):
+        input("""Track log {0} could not be compiled.\n\nPress any key to quit...""".format(log_path))
+    quit()
+
+
+def get_parser(prog=None, description='Image GeoTagger metadata setter'):
+    parser = argparse.ArgumentParser(prog=prog, description=description)
+
+    parser.add_argument('input_path',
                         action='store',
                         help='Path to input image or directory of images.')
 
     parser.add_argument('-t', '--track-log',
                         action='store',
                         default=None,
-                        help='Path to GPS track log file.')
+                        help='Path to GPS track log file, a track store made with compile-track, '
+                             'or a directory or glob pattern of track logs to merge.')
+
+    parser.add_argument('--track-merge',
+                        action='store',
+                        dest='track_merge',
+                        default='priority',
+                        choices=TRACK_MERGE_RULES,
+                        help='How to choose between track logs with a point at the same time.')
+
+    parser.add_argument('--track-priority',
+                        action='store',
+                        dest='track_priority',
+                        default=None,
+                        help='Comma separated track log file names, highest priority first.')
 
     parser.add_argument('-m', '--mode',
                         action='store',
@@ -447,6 +2804,84 @@ if __name__ == '__main__':
                         default=0,
                         help='Normalise images which distance in meter is more than parameter')
 
+    parser.add_argument('--auto-offset',
+                        action='store_true',
+                        dest='auto_offset',
+                        help='Estimate and correct the camera clock offset against the track log.')
+
+    parser.add_argument('--max-offset',
+                        action='store',
+                        dest='max_offset',
+                        default=7200,
+                        help='Largest camera clock offset in seconds searched by --auto-offset.')
+
+    parser.add_argument('-s', '--max-speed',
+                        action='store',
+                        dest='max_speed',
+                        default=0,
+                        help='Discard images which implied speed in meters per second is more than parameter')
+
+    parser.add_argument('--smooth',
+                        action='store',
+                        dest='smooth',
+                        default=0,
+                        help='Smooth images geo position with a rolling median over parameter images')
+
+    parser.add_argument('--dem-dir',
+                        action='store',
+                        default=None,
+                        dest='dem_directory',
+                        help='Optional: folder of DEM tiles (SRTM .hgt or GeoTIFF) to take altitudes from.')
+
+    parser.add_argument('--dem-mode',
+                        action='store',
+                        default='fill',
+                        dest='dem_mode',
+                        choices=DEM_MODES,
+                        help='Take altitudes from the DEM only for images without one (fill), '
+                             'or for all images (replace).')
+
+    parser.add_argument('--heading',
+                        action='store_true',
+                        dest='heading',
+                        help='Write the direction towards the next image as GPSImgDirection.')
+
+    parser.add_argument('--pitch',
+                        action='store_true',
+                        dest='pitch',
+                        help='Write the pitch towards the next image, from the altitudes, as PosePitchDegrees.')
+
+    parser.add_argument('-o', '--output-format',
+                        action='store',
+                        dest='output_format',
+                        default='embed',
+                        choices=OUTPUT_FORMATS,
+                        help='Write the tags into copies of the images, or to XMP sidecars next to hard links of them.')
+
+    parser.add_argument('--shards',
+                        action='store',
+                        default=1,
+                        dest='shards',
+                        help='Number of time partitions the images are read, planned and written in, in parallel.')
+
+    parser.add_argument('--shard-dir',
+                        action='store',
+                        default=None,
+                        dest='shard_directory',
+                        help='Optional: empty folder on a shared filesystem where the shard tasks are published, '
+                             'for shard-worker processes on other machines to run.')
+
+    parser.add_argument('--watch',
+                        action='store_true',
+                        dest='watch',
+                        help='Keep running and geotag images as they are added to the input folder.')
+
+    parser.add_argument('--watch-interval',
+                        action='store',
+                        dest='watch_interval',
+                        default=WATCH_INTERVAL,
+                        help='Seconds between checks of the input folder in watch mode.')
+
     parser.add_argument('-e', '--exiftool-exec-path',
                         action='store',
                         default='No path specified',
@@ -462,10 +2897,280 @@ if __name__ == '__main__':
                         action='version',
                         version='%(prog)s 1.0')
 
-    input_args = parser.parse_args()
+    return parser
+
+
+def embed_sidecars_command(argv):
+    parser = argparse.ArgumentParser(prog='image-geotagger.py embed-sidecars',
+                                     description='Write the tags of XMP sidecars into the images next to them')
+
+    parser.add_argument('directory',
+                        action='store',
+                        help='Output folder of a run with --output-format sidecar.')
+
+    parser.add_argument('-e', '--exiftool-exec-path',
+                        action='store',
+                        default='No path specified',
+                        dest='executable_path',
+                        help='Optional: path to Exiftool executable.')
+
+    embed_args = parser.parse_args(argv)
+    try:
+        if not os.path.isdir(embed_args.directory):
+            raise GeotaggerError('Folder {0} does not exist!'.format(os.path.abspath(embed_args.directory)))
+        is_win_shell = configure_exiftool(embed_args.executable_path)
+    except GeotaggerError as e:
+        input('{0}\n\nPress any key to quit...'.format(e))
+        quit()
+
+    with exiftool.ExifTool(win_shell=is_win_shell) as et:
+        embedded = embed_sidecars(et, os.path.abspath(embed_args.directory))
+    input('\nMetadata of {0} sidecar(s) successfully embedded into images.\n\nPress any key to quit'.format(embedded))
+    quit()
+
+
+def shard_worker_command(argv):
+    parser = argparse.ArgumentParser(prog='image-geotagger.py shard-worker',
+                                     description='Run the tasks a sharded run publishes in a shard folder')
+
+    parser.add_argument('shard_directory',
+                        action='store',
+                        help='The --shard-dir folder of the run, on a shared filesystem.')
+
+    parser.add_argument('--interval',
+                        action='store',
+                        type=float,
+                        default=SHARD_POLL_INTERVAL,
+                        help='Seconds between checks for new tasks.')
+
+    parser.add_argument('-e', '--exiftool-exec-path',
+                        action='store',
+                        default='No path specified',
+                        dest='executable_path',
+                        help='Optional: path to Exiftool executable.')
+
+    worker_args = parser.parse_args(argv)
+    shard_directory = os.path.abspath(worker_args.shard_directory)
+    try:
+        is_win_shell = configure_exiftool(worker_args.executable_path)
+    except GeotaggerError as e:
+        print(e)
+        sys.exit(1)
+
+    print('Waiting for tasks in {0}, press Ctrl+C to stop...'.format(shard_directory))
+    count = 0
+    with exiftool.ExifTool(win_shell=is_win_shell) as et:
+        try:
+            while not os.path.exists(os.path.join(shard_directory, SHARD_FINISHED_FILE)):
+                if run_shard_directory_task(shard_directory, et):
+                    count += 1
+                else:
+                    time.sleep(worker_args.interval)
+        except KeyboardInterrupt:
+            print('\nStopped waiting for tasks')
+    print('{0} task(s) run'.format(count))
+    sys.exit(0)
+
+
+def serve_command(argv):
+    parser = argparse.ArgumentParser(prog='image-geotagger.py serve',
+                                     description='Run a local geotagging service with a pool of warm workers')
+
+    parser.add_argument('--host',
+                        action='store',
+                        default=SERVICE_HOST,
+                        help='Address to listen on.')
+
+    parser.add_argument('--port',
+                        action='store',
+                        type=int,
+                        default=SERVICE_PORT,
+                        help='Port to listen on.')
+
+    parser.add_argument('-w', '--workers',
+                        action='store',
+                        type=int,
+                        default=None,
+                        help='Number of jobs run at the same time. Default is the number of CPU cores.')
+
+    parser.add_argument('-e', '--exiftool-exec-path',
+                        action='store',
+                        default='No path specified',
+                        dest='executable_path',
+                        help='Optional: path to Exiftool executable.')
 
-    if input_args.discard and input_args.normalise:
-        input("""You can't use discard(-d) and normalise(-n) argument in same time.\n\nPress any key to quit...""")
+    serve_args = parser.parse_args(argv)
+    try:
+        configure_exiftool(serve_args.executable_path)
+    except GeotaggerError as e:
+        input('{0}\n\nPress any key to quit...'.format(e))
         quit()
 
+    pool = GeotagWorkerPool(serve_args.workers, serve_args.executable_path)
+    try:
+        serve(pool, serve_args.host, serve_args.port)
+    finally:
+        pool.shutdown()
+    quit()
+
+
+def submit_command(argv):
+    parser = get_parser(prog='image-geotagger.py submit', description='Submit a job to a local geotagging service')
+
+    parser.add_argument('--server',
+                        action='store',
+                        default='http://{0}:{1}'.format(SERVICE_HOST, SERVICE_PORT),
+                        help='Address of the geotagging service.')
+
+    parser.add_argument('--wait',
+                        action='store_true',
+                        help='Wait for the job to finish and print its metrics.')
+
+    submit_args = parser.parse_args(argv)
+    options = {key: value for key, value in vars(submit_args).items()
+               if key not in ['server', 'wait', 'watch', 'watch_interval'] and value != parser.get_default(key)}
+    for key in ['input_path', 'output_directory', 'track_log', 'dem_directory']:
+        if options.get(key):
+            options[key] = os.path.abspath(options[key])
+
+    try:
+        job = service_request(submit_args.server, 'POST', '/jobs', options)
+        print('Job {0} {1}'.format(job['id'], job['status']))
+        while submit_args.wait and job['status'] in ['queued', 'running']:
+            time.sleep(1)
+            job = service_request(submit_args.server, 'GET', '/jobs/{0}'.format(job['id']))
+        if submit_args.wait:
+            print_job(job)
+    except GeotaggerError as e:
+        print(e)
+        sys.exit(1)
+    sys.exit(1 if job['status'] == 'failed' else 0)
+
+
+def status_command(argv):
+    parser = argparse.ArgumentParser(prog='image-geotagger.py status',
+                                     description='Show the jobs of a local geotagging service')
+
+    parser.add_argument('job_id',
+                        action='store',
+                        nargs='?',
+                        default=None,
+                        help='Job to show. Default is to list all jobs.')
+
+    parser.add_argument('--server',
+                        action='store',
+                        default='http://{0}:{1}'.format(SERVICE_HOST, SERVICE_PORT),
+                        help='Address of the geotagging service.')
+
+    status_args = parser.parse_args(argv)
+    try:
+        if status_args.job_id:
+            print_job(service_request(status_args.server, 'GET', '/jobs/{0}'.format(status_args.job_id)))
+        else:
+            for job in service_request(status_args.server, 'GET', '/jobs'):
+                print('{0}  {1:<8}  {2}'.format(job['id'], job['status'], time.ctime(job['submitted_at'])))
+    except GeotaggerError as e:
+        print(e)
+        sys.exit(1)
+    sys.exit(0)
+
+
+def batch_command(argv):
+    parser = argparse.ArgumentParser(prog='image-geotagger.py batch',
+                                     description='Run the geotagging jobs of a manifest on a shared pool of workers')
+
+    parser.add_argument('manifest',
+                        action='store',
+                        help='JSON list of job options, or CSV file with a column per option.')
+
+    parser.add_argument('-w', '--workers',
+                        action='store',
+                        type=int,
+                        default=None,
+                        help='Number of jobs run at the same time. Default is the number of CPU cores.')
+
+    parser.add_argument('--summary',
+                        action='store',
+                        default=None,
+                        help='Optional: path to save the summary of the jobs to, as JSON.')
+
+    parser.add_argument('-e', '--exiftool-exec-path',
+                        action='store',
+                        default='No path specified',
+                        dest='executable_path',
+                        help='Optional: path to Exiftool executable.')
+
+    batch_args = parser.parse_args(argv)
+    try:
+        configure_exiftool(batch_args.executable_path)
+        jobs = read_batch_manifest(batch_args.manifest)
+    except GeotaggerError as e:
+        print(e)
+        sys.exit(1)
+
+    print('Running {0} job(s) from {1}'.format(len(jobs), os.path.abspath(batch_args.manifest)))
+    start = time.perf_counter()
+    summary = get_batch_summary(run_batch(jobs, batch_args.workers, batch_args.executable_path),
+                                time.perf_counter() - start)
+    print_batch_summary(summary)
+
+    if batch_args.summary:
+        import json
+
+        with open(batch_args.summary, 'w', encoding='utf-8') as fh:
+            json.dump(summary, fh, indent=2)
+        print('Summary saved to {0}'.format(os.path.abspath(batch_args.summary)))
+    sys.exit(1 if summary['failed'] or summary['cancelled'] else 0)
+
+
+def print_batch_summary(summary):
+    """
+    Print a line per batch job, the errors of the failed jobs and the totals.
+    """
+    print('')
+    for job in summary['jobs']:
+        print('{0:<9} {1:>7} file(s) {2:>7} written {3:>8.1f} s {4:>8.1f} images/s  {5}'.format(
+            job['status'], job['files'], job['written'], job['seconds'], job['images_per_second'],
+            job['input_path']))
+    for job in summary['jobs']:
+        if job['status'] == 'failed':
+            print('\n{0}: {1}'.format(job['input_path'], job['error']))
+    print('\n{0} job(s) done, {1} failed, {2} cancelled, {3} image(s) written in {4:.1f} s ({5:.1f} images/s)'.format(
+        summary['done'], summary['failed'], summary['cancelled'], summary['written'], summary['seconds'],
+        summary['images_per_second']))
+
+
+def print_job(job):
+    """
+    Print the status, error and metrics of a job.
+    """
+    print('Job {0}: {1}'.format(job['id'], job['status']))
+    if job.get('error'):
+        print(job['error'])
+    metrics = job.get('metrics')
+    if metrics:
+        print('{0} file(s), {1} image(s) geotagged, {2} discarded, {3:.1f} images/s'.format(
+            metrics['files'], metrics['written'], metrics['discarded'], metrics['images_per_second']))
+        print('queued {0:.2f} s, run {1:.2f} s ({2})'.format(
+            job['queued_seconds'], job['run_seconds'],
+            ', '.join('{0} {1:.2f} s'.format(stage, seconds) for stage, seconds in metrics['seconds'].items())))
+
+
+COMMANDS = {
+    'batch': batch_command,
+    'compile-track': compile_track_command,
+    'embed-sidecars': embed_sidecars_command,
+    'shard-worker': shard_worker_command,
+    'serve': serve_command,
+    'submit': submit_command,
+    'status': status_command,
+}
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        COMMANDS[sys.argv[1]](sys.argv[2:])
+
+    input_args = get_parser().parse_args()
+
     geo_tagger(input_args)